@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Summarize every run log under subj_info/ in one table.
+
+Logs are "marks": epoch seconds then a description (see readme).
+Each log is parsed in a worker process into numpy arrays
+(pulse times, block flip delays) and reduced to one row:
+  * tr1, tr2: median interval after even and odd pulses (likely BOLD, VASO)
+  * jitter_ms, maxdev_ms: sd and worst deviation of intervals from their TR
+  * missing, extra: pulse intervals too long (pulses skipped) or too short
+  * start_ms: start pulse to first block on screen
+  * flip_p50_ms, flip_max_ms: pulse to block flip for all blocks
+
+  python analyze_logs.py subj_info/ --out runs.csv
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import tracefile
+
+LOG_GLOB = "sub-*/ses-*/*/log/*.log"  #: relative to subj_info/
+MISSING_FRAC = 1.5  #: interval this many times its TR means a missed pulse
+EXTRA_FRAC = 0.5  #: interval this short means a spurious pulse
+
+#: description patterns. psychopy times of pulses and pulse to flip delays
+START_RE = re.compile(r"STARTING: recieved first TR pulse (\S+)")
+PULSE_RE = re.compile(r"Pulse \d+ for block \d+ recieved ([\d.]+)")  # grasp_trcount
+CHECKER_PULSE_RE = re.compile(r"pulse \S+ \(([\d.]+)\)")  # checkboard
+FLIP_RE = re.compile(r"(\S+) flip (\S+) secs after pulse")
+#: block marks in logs without flip delays. grasp_trcount: label. checkboard: "block {label}"
+BLOCK_NAMES = {"Relax", "Grasp", "block Grid", "block Relax"}
+TRACE_LOG = "_trace.log"  #: tracefile.py conversions. not runs of their own
+
+
+def parse_log(path):
+    """Pulses and block timing from one log.
+    Runs with --trace have no pulse marks: pulses are read from the .trace next to the log.
+    @return dict of numpy arrays: pulses (psychopy s), flip_delay (s);
+            and start_latency (s, nan if unknown), nlines
+    """
+    pulses = []
+    flips = []
+    start_epoch = None
+    first_block_epoch = None
+    nlines = 0
+    with open(path, errors="replace") as f:
+        for line in f:
+            nlines += 1
+            epoch, _, desc = line.rstrip("\n").partition(" ")
+            if m := PULSE_RE.match(desc) or CHECKER_PULSE_RE.match(desc):
+                pulses.append(float(m.group(1)))
+            elif m := FLIP_RE.match(desc):
+                flips.append(float(m.group(2)))
+            elif m := START_RE.match(desc):
+                pulses.append(float(m.group(1)))
+                start_epoch = float(epoch)
+            elif start_epoch and first_block_epoch is None and desc in BLOCK_NAMES:
+                # older logs: no "flip ... after pulse". use time between marks
+                first_block_epoch = float(epoch)
+
+    trace = tracefile.trace_path(path)
+    if os.path.exists(trace):
+        pulses = tracefile.pulse_times(tracefile.read_trace(trace)[0])
+
+    flips = np.array(flips)
+    if len(flips):
+        start_latency = flips[0]
+    elif first_block_epoch is not None:
+        start_latency = first_block_epoch - start_epoch
+    else:
+        start_latency = np.nan
+    return {
+        "pulses": np.array(pulses),
+        "flip_delay": flips,
+        "start_latency": start_latency,
+        "nlines": nlines,
+    }
+
+
+def pulse_stats(pulses):
+    """TR estimates, jitter, and missing/extra pulse counts from pulse times.
+    Intervals alternate between two TRs (BOLD and VASO).
+    >>> s = pulse_stats(np.cumsum([0, .5, .4, .5, .4, 1.4, .4, .1]))
+    >>> round(float(s["tr1"]), 3), round(float(s["tr2"]), 3), s["missing"], s["extra"]
+    (0.5, 0.4, 2, 1)
+    """
+    iv = np.diff(pulses)
+    stats = {"npulses": len(pulses), "tr1": np.nan, "tr2": np.nan,
+             "jitter_ms": np.nan, "maxdev_ms": np.nan, "missing": 0, "extra": 0}
+    if len(iv) < 2:
+        return stats
+    tr1, tr2 = np.median(iv[0::2]), np.median(iv[1::2])
+    expected = np.where(np.arange(len(iv)) % 2 == 0, tr1, tr2)
+    long = iv > MISSING_FRAC * max(tr1, tr2)
+    short = iv < EXTRA_FRAC * min(tr1, tr2)
+    ok = ~(long | short)
+    dev = (iv - expected)[ok] * 1000
+    cycle = (tr1 + tr2) / 2
+    stats.update(
+        tr1=tr1,
+        tr2=tr2,
+        jitter_ms=dev.std() if len(dev) else np.nan,
+        maxdev_ms=np.abs(dev).max() if len(dev) else np.nan,
+        missing=int(np.maximum(np.round(iv[long] / cycle) - 1, 1).sum()),
+        extra=int(short.sum()),
+    )
+    return stats
+
+
+def summarize(path):
+    "One summary row for a log file. Runs in a worker process."
+    parsed = parse_log(path)
+    flips = parsed["flip_delay"] * 1000
+    return {
+        "log": path,
+        **pulse_stats(parsed["pulses"]),
+        "start_ms": parsed["start_latency"] * 1000,
+        "nblocks": len(flips),
+        "flip_p50_ms": np.median(flips) if len(flips) else np.nan,
+        "flip_max_ms": flips.max() if len(flips) else np.nan,
+    }
+
+
+def find_logs(root):
+    "Run logs under root (subj_info/). Sorted. Trace conversions (*_trace.log) skipped."
+    logs = glob.glob(os.path.join(root, LOG_GLOB))
+    return sorted(log for log in logs if not log.endswith(TRACE_LOG))
+
+
+def analyze(root, workers=None):
+    """Summary DataFrame of every log under root, parsed in parallel.
+    @param workers processes. default os.cpu_count()
+    """
+    import pandas as pd
+
+    logs = find_logs(root)
+    with ProcessPoolExecutor(workers) as pool:
+        rows = list(pool.map(summarize, logs, chunksize=16))
+    return pd.DataFrame(rows)
+
+
+def analyze_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Summarize task logs")
+    parser.add_argument("root", nargs="?", default="subj_info", help="subj_info directory")
+    parser.add_argument("--out", default=None, help="csv. default print")
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = analyze_args(in_args)
+    runs = analyze(args.root, args.workers)
+    if args.out:
+        runs.to_csv(args.out, index=False, float_format="%0.4f")
+        print(f"wrote {len(runs)} runs to {args.out}")
+    else:
+        print(runs.to_string(float_format="%0.3f"))
+    return runs
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
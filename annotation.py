@@ -0,0 +1,78 @@
+"""
+--annotate overlay without re-laying out text on every pulse.
+
+Setting TextStim.text lays out all glyphs again. The overlay is split into
+  * counters (block, pulse): drawn from digit TextStims built once,
+    one set per digit slot, so changing a number only changes which stims are drawn
+  * static text (block label, TRs): re-laid out only when it changes
+"""
+
+import psychopy.visual
+
+GLYPHS = "0123456789?"  #: pre-rendered per slot. '?' for a counter not known yet
+DIGIT_WIDTH = 0.6  #: slot width as a fraction of text height
+COLOR = [-0.8, -0.8, -0.8]  #: dark gray. same as the old annotation TextStim
+POS = (0.5, -0.8)  #: center-right, bottom of screen
+
+
+class Annotation:
+    """
+    Counters then static text, left to right from pos.
+    update() is cheap when only counters change. draw() does not flip.
+    """
+
+    def __init__(self, win, ncounters=2, ndigits=3, pos=POS, color=COLOR):
+        """
+        @param win       window
+        @param ncounters integers shown before the static text
+        @param ndigits   slots per counter. larger values show their last digits
+        @param pos       left edge of the first counter
+        @param color     rgb for all text
+        """
+        self.ndigits = ndigits
+        self.static = psychopy.visual.TextStim(
+            win, text="", color=color, colorSpace="rgb", anchorHoriz="left", name="annotation"
+        )
+        step = self.static.height * DIGIT_WIDTH
+        x, y = pos
+        # slots[counter][digit] -> {glyph: TextStim}
+        self.slots = []
+        for _ in range(ncounters):
+            digits = []
+            for _ in range(ndigits):
+                digits.append(
+                    {
+                        g: psychopy.visual.TextStim(
+                            win, text=g, pos=(x, y), color=color, colorSpace="rgb"
+                        )
+                        for g in GLYPHS
+                    }
+                )
+                x += step
+            self.slots.append(digits)
+            x += step  # space between counters
+        self.static.pos = (x, y)
+        self.static_text = ""
+        self.shown = []  # glyph stims to draw for current counters
+
+    def update(self, counters, static=None):
+        """Set what draw() shows.
+        @param counters ints (None shows '?'), one per counter
+        @param static   text after the counters. unchanged text is not laid out again
+        """
+        if static is not None and static != self.static_text:
+            self.static.text = static
+            self.static_text = static
+        self.shown = []
+        for digits, value in zip(self.slots, counters):
+            text = "?" if value is None else str(value)[-self.ndigits :]
+            # right align in the counter's slots
+            start = self.ndigits - len(text)
+            for slot, glyph in zip(digits[start:], text):
+                self.shown.append(slot[glyph])
+
+    def draw(self):
+        "Draw counters and static text to the back buffer."
+        for stim in self.shown:
+            stim.draw()
+        self.static.draw()
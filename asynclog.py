@@ -0,0 +1,80 @@
+"""
+Log writer that keeps string formatting and file io off the hot path.
+
+FileLogger and ExternalCom format, write, and print each mark as it happens,
+right next to the timing critical flip.
+AsyncLogger only timestamps and queues (format, args) when marked.
+A background thread formats and writes when flush() is called (block boundaries)
+and fsyncs on close(). Lines match FileLogger: "{epoch:.5f} {message}"
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class AsyncLogger:
+    """
+    Queue marks now, write them later on a background thread.
+    collections.deque append/popleft are atomic: no lock in push().
+    """
+
+    def __init__(self, path=None, echo=True):
+        """
+        @param path log file. None to only echo
+        @param echo also print lines to stdout (like ExternalCom)
+        """
+        self.queue = collections.deque()
+        self.fh = open(path, "w") if path else None
+        self.echo = echo
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="asynclog", daemon=True)
+        self._thread.start()
+
+    def push(self, fmt, args=()):
+        """Queue a mark. Timestamp taken now, formatting done later.
+        @param fmt  message or str.format template
+        @param args values for fmt. empty: fmt used as is
+        """
+        self.queue.append((time.time(), fmt, args))
+
+    def flush(self):
+        "Ask background thread to write and flush what's queued."
+        self._wake.set()
+
+    def close(self):
+        "Write everything left, flush, and fsync. Call at the end of the run."
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        if self.fh is not None:
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            self.fh.close()
+            self.fh = None
+
+    def _write_queued(self):
+        lines = []
+        while self.queue:
+            epoch, fmt, args = self.queue.popleft()
+            msg = fmt.format(*args) if args else fmt
+            lines.append(f"{epoch:.5f} {msg}\n")
+        if not lines:
+            return
+        text = "".join(lines)
+        if self.fh is not None:
+            self.fh.write(text)
+            self.fh.flush()
+        if self.echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            self._wake.clear()
+            self._write_queued()
+        self._write_queued()
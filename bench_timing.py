@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "lncdtask",
+#     "psychopy-visionscience",
+# ]
+#
+# [tool.uv.sources]
+# lncdtask = { git = "https://github.com/LabNeuroCogDevel/lncdtask" }
+# ///
+"""
+Timing benchmark for grasp_trcount, checkboard (checkers), and grasp_task.
+
+Each task runs in one shared (not fullscreen) window against a SimulatedScanner
+with a fixed seed. Results are written as json for comparing commits,
+PsychoPy versions, and the lncdtask flip_at path (grasp_task):
+  * flip intervals (win.recordFrameIntervals)
+  * dropped frames: psychopy's count and flips that missed the first vsync after drawing
+  * pulse to flip latency percentiles (see latency.py)
+  * cpu and wall time of the pulse loop (start pulse to last block)
+
+  uv run --script ./bench_timing.py --out bench.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import psychopy
+from lncdtask.lncdtask import create_window
+import grasp_trcount
+import checkboard
+import grasp_task
+from frameclock import FrameClock, frames_late
+from stimcache import for_window
+
+#: task name -> (args_to_settings, main, task specific args)
+TASKS = {
+    "grasp_trcount": (grasp_trcount.args_to_settings, grasp_trcount.main, ["--no-fullscreen"]),
+    "checkers": (checkboard.args_to_settings, checkboard.main, ["--no-fullscreen"]),
+    "grasp_task": (grasp_task.args_to_settings, grasp_task.main, []),
+}
+
+
+def git_commit():
+    "Current commit. Empty string if not in a git checkout."
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        )
+        return out.stdout.strip()
+    except OSError:
+        return ""
+
+
+def interval_stats(intervals):
+    "Summary of flip intervals (seconds) in milliseconds."
+    iv = np.asarray(intervals) * 1000
+    if len(iv) == 0:
+        return {"n": 0}
+    return {
+        "n": len(iv),
+        "mean_ms": iv.mean(),
+        "sd_ms": iv.std(),
+        "p99_ms": np.percentile(iv, 99),
+        "max_ms": iv.max(),
+    }
+
+
+def bench_task(name, win, period, task_args):
+    """Run one task and collect timing.
+    @param name      key of TASKS
+    @param win       shared window with recordFrameIntervals on
+    @param period    measured refresh period
+    @param task_args command line args for the task's args_to_settings
+    """
+    args_to_settings, main, extra_args = TASKS[name]
+    settings = args_to_settings(task_args + extra_args)
+    win.frameIntervals = []
+    win.nDroppedFrames = 0
+
+    total = time.perf_counter()
+    hc = main(settings, win=win)
+    total = time.perf_counter() - total
+    # task loop only. not imports, dialog, instructions, or saving
+    wall, cpu = hc.loop_times
+
+    result = {
+        "settings": dict(settings),
+        "total_wall_s": total,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "cpu_frac": cpu / wall,
+        "flip_intervals": interval_stats(win.frameIntervals),
+        "psychopy_dropped": win.nDroppedFrames,
+    }
+    latency = getattr(hc, "latency", None)
+    if latency is not None:
+        result["latency_ms"] = latency.summary()
+        # classified as FrameRing does. see frameclock.frames_late
+        result["missed_vsync"] = sum(
+            frames_late(flip, drawn, period) > 0 for _, _, drawn, flip in latency.rows
+        )
+    return result
+
+
+def bench_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Task timing benchmark")
+    parser.add_argument("--tasks", nargs="+", default=list(TASKS), choices=list(TASKS))
+    parser.add_argument("--trs", default="0.576,0.448", help="simulated TR pattern")
+    parser.add_argument("--jitter", default="0", help="simulated pulse jitter (sd, s)")
+    parser.add_argument("--ntr", default="4", help="pulses per block (TR tasks)")
+    parser.add_argument("--ntrials", default="2", help="rest+grasp pairs")
+    parser.add_argument("--dur", default="2", help="block seconds (grasp_task)")
+    parser.add_argument("--out", default=None, help="json file. default bench-{epoch}.json")
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = bench_args(in_args)
+    common = ["--no-dialog", "--no-logging", "--subjid", "bench", "--ntrials", args.ntrials]
+    common += ["--simulate", args.trs, "--sim-jitter", args.jitter, "--sim-seed", "1"]
+    task_args = {
+        "grasp_trcount": common + ["--trs", args.ntr],
+        "checkers": common + ["--trs", args.ntr],
+        "grasp_task": common + ["--dur", args.dur],
+    }
+
+    win = create_window(False)
+    # same measurement the tasks use. refresh is measured once per window
+    clock = for_window(win).shared("clock", lambda: FrameClock(win))
+    win.recordFrameIntervals = True
+
+    results = {
+        "commit": git_commit(),
+        "psychopy": psychopy.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "refresh_hz": clock.rate,
+        "tasks": {},
+    }
+    for name in args.tasks:
+        results["tasks"][name] = bench_task(name, win, clock.period, task_args[name])
+    win.close()
+
+    out = args.out or f"bench-{time.time():.0f}.json"
+    with open(out, "w") as f:
+        json.dump(results, f, indent=1, default=float)
+    print(f"wrote {out}")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
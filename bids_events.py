@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+BIDS *_events.tsv (onset, duration, trial_type) for task runs.
+
+Onsets are seconds from the first scanner pulse (onset0 in the run csv).
+Files are named for BIDS (see bids_path): sub-<id>_ses-<ses>_task-<task>_run-<n>_events.tsv
+Each block lasts until the next one starts; the last until the final pulse.
+Tasks write the tsv next to the run csv at the end of the run (HandGrasp.save_bids_events).
+Runs recorded before that are converted in bulk, in a process pool.
+Their final pulse is read from the run's log or its --trace file (see analyze_logs.parse_log):
+
+  python bids_events.py subj_info/
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from analyze_logs import parse_log
+
+CSV_GLOB = "sub-*/ses-*/*/*_tr1-*.csv"  #: grasp_tr1-* and checkers_tr1-* run csvs
+EPOCH_RE = re.compile(r"-(\d+)\.(csv|log)$")
+TASK_RE = re.compile(r"^([^_]+)_tr1-")  #: task label from the run csv name. grasp or checkers
+NA = "n/a"  #: BIDS missing value
+
+
+def events_rows(onsets, names, end=None):
+    """BIDS rows with durations from consecutive onsets.
+    @param onsets seconds from first pulse, in order
+    @param names  trial_type of each
+    @param end    final pulse (seconds from first). last duration n/a without it
+    >>> events_rows([0.1, 2.1], ["Relax", "Grasp"], 4.0)
+    [('0.1000', '2.0000', 'Relax'), ('2.1000', '1.9000', 'Grasp')]
+    """
+    onsets = [float(t) for t in onsets]
+    ends = onsets[1:] + [end]
+    rows = []
+    for onset, stop, name in zip(onsets, ends, names):
+        dur = NA if stop is None or stop < onset else f"{stop - onset:0.4f}"
+        rows.append((f"{onset:0.4f}", dur, name))
+    return rows
+
+
+def bids_label(text):
+    """BIDS labels are alphanumeric only.
+    >>> bids_label("AAA_2")
+    'AAA2'
+    """
+    return re.sub(r"[^A-Za-z0-9]", "", str(text))
+
+
+def bids_path(run_csv, suffix="events", ext=".tsv"):
+    """BIDS name for a file next to the run csv.
+    Subject and session are from the sub-*/ses-* directories above the csv,
+    task from the csv name. run is 1 + the session's earlier runs of the same task.
+    >>> bids_path("subj_info/sub-AAA/ses-01/20260205_grasp/grasp_tr1-0.576_tr2-0.448-1770315169.csv")
+    'subj_info/sub-AAA/ses-01/20260205_grasp/sub-AAA_ses-01_task-grasp_run-1_events.tsv'
+    """
+    run_csv = str(run_csv)
+    task = TASK_RE.match(os.path.basename(run_csv)).group(1)
+    epoch = int(EPOCH_RE.search(run_csv).group(1))
+    parts = os.path.normpath(run_csv).split(os.sep)
+    sub = [p[4:] for p in parts if p.startswith("sub-")]
+    ses = [p[4:] for p in parts if p.startswith("ses-")]
+    # same task's runs in the session: ses-*/{date}_{task}/*.csv
+    entities = [i for i, p in enumerate(parts) if p.startswith(("sub-", "ses-"))]
+    session_dir = os.sep.join(parts[: entities[-1] + 1]) if entities else os.path.dirname(os.path.dirname(run_csv))
+    runs = glob.glob(os.path.join(session_dir, "*", f"{task}_tr1-*.csv"))
+    earlier = [r for r in runs if EPOCH_RE.search(r) and int(EPOCH_RE.search(r).group(1)) < epoch]
+
+    name = f"sub-{bids_label(sub[-1])}_" if sub else ""
+    name += f"ses-{bids_label(ses[-1])}_" if ses else ""
+    name += f"task-{bids_label(task)}_run-{len(earlier) + 1}_{suffix}{ext}"
+    return os.path.join(os.path.dirname(run_csv), name)
+
+
+def write_events(path, onsets, names, end=None):
+    """Write BIDS events tsv.
+    @return path
+    """
+    with open(path, "w") as f:
+        f.write("onset\tduration\ttrial_type\n")
+        for row in events_rows(onsets, names, end):
+            f.write("\t".join(row) + "\n")
+    return path
+
+
+def run_log(run_csv):
+    """Log of the run that wrote run_csv: the latest in log/ started before the csv was written.
+    @return path or None
+    """
+    csv_epoch = int(EPOCH_RE.search(run_csv).group(1))
+    best = None
+    for log in glob.glob(os.path.join(os.path.dirname(run_csv), "log", "*.log")):
+        m = EPOCH_RE.search(log)
+        if m and int(m.group(1)) <= csv_epoch:
+            if best is None or int(m.group(1)) > best[0]:
+                best = (int(m.group(1)), log)
+    return best[1] if best else None
+
+
+def convert(run_csv):
+    """Write events tsv for an existing run csv. Runs in a worker process.
+    @return tsv path
+    """
+    import pandas as pd
+
+    events = pd.read_csv(run_csv)
+    end = None
+    log = run_log(run_csv)
+    if log:
+        pulses = parse_log(log)["pulses"]
+        if len(pulses):
+            end = pulses[-1] - pulses[0]
+    return write_events(bids_path(run_csv), events.onset0, events.event_name, end)
+
+
+def convert_all(root, workers=None):
+    """Convert every run csv under root (subj_info/) in parallel.
+    @return list of tsv paths
+    """
+    csvs = sorted(glob.glob(os.path.join(root, CSV_GLOB)))
+    # skip sidecars like *_latency.csv
+    csvs = [c for c in csvs if EPOCH_RE.search(c)]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(convert, csvs, chunksize=8))
+
+
+def bids_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Write BIDS events.tsv for existing runs")
+    parser.add_argument("root", nargs="?", default="subj_info", help="subj_info directory")
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = bids_args(in_args)
+    written = convert_all(args.root, args.workers)
+    print(f"wrote {len(written)} events.tsv files")
+    return written
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
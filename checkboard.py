@@ -10,6 +10,10 @@
 # lncdtask = { git = "https://github.com/LabNeuroCogDevel/lncdtask" }
 # ///
 
+import time
+
+IMPORT_START = time.perf_counter()  #: launch time for startup timing
+
 import argparse
 import sys
 import psychopy
@@ -19,11 +23,14 @@ from lncdtask.lncdtask import (
     RunDialog,
     FileLogger,
     ExternalCom,
-    create_window,
 )
-import pandas as pd
 import numpy as np
-from grasp_trcount import HandGrasp, args_to_settings
+from grasp_trcount import HandGrasp, args_to_settings, new_task, CLI_ONLY
+from startup import StartupTimer, hide_window, prewarm
+from asynclog import AsyncLogger
+from frameclock import FrameClock, FrameRing
+from latency import sidecar_path
+import tracefile
 
 STIM_PER_SEC = 1 / 8  #: flip checkers every 8 Hz
 CHECKER_SIZE = 0.2  #: size of single checker rectangle. (fullsreen=2)
@@ -38,14 +45,53 @@ TRIGGERS = [
 ]  #: what key advances the get ready screen? TTL to key via button box
 
 
-def draw_checkers(rect, offset=0, size=CHECKER_SIZE):
-    # -1,-1 is left, bottom. x is first, left<->right
-    for i, x in enumerate(np.arange(-1 - size / 2, 1, size * 2)):
-        for y in np.arange(-1 + size / 2, 1, size * 2):
-            rect.pos = (x + offset * size, y)
-            rect.draw()
-            rect.pos = (x + size + offset * size, y + size)
-            rect.draw()
+def checker_xys(offset=0, size=CHECKER_SIZE):
+    """Centers of the white squares of a checkerboard covering the screen.
+    -1,-1 is left, bottom. x is first, left<->right
+    @param offset 0 or 1. 1 shifts by one square: inverted board
+    @param size   width and height of a single checker
+    @return (n, 2) array of x, y positions
+    """
+    x, y = np.meshgrid(
+        np.arange(-1 - size / 2, 1, size * 2),
+        np.arange(-1 + size / 2, 1, size * 2),
+        indexing="ij",
+    )
+    x = x.ravel() + offset * size
+    y = y.ravel()
+    # two white squares per 2x2 tile: bottom-left and top-right
+    return np.concatenate(
+        [np.column_stack([x, y]), np.column_stack([x + size, y + size])]
+    )
+
+
+class CheckerBoard:
+    """
+    Whole checkerboard as a single ElementArrayStim per phase.
+    Both phases are uploaded once. Drawing is one GL call
+    regardless of checker size or grid density.
+    """
+
+    def __init__(self, win, size=CHECKER_SIZE):
+        self.phases = []
+        for offset in (0, 1):
+            xys = checker_xys(offset, size)
+            board = psychopy.visual.ElementArrayStim(
+                win,
+                nElements=len(xys),
+                xys=xys,
+                sizes=size,
+                elementTex=np.ones((2, 2)),  # solid square
+                elementMask=None,
+                colors=[1, 1, 1],
+                colorSpace="rgb",
+                name=f"checkers-{offset}",
+            )
+            self.phases.append(board)
+
+    def draw(self, invert=0):
+        "Draw normal (0) or inverted (1) board. Caller flips."
+        self.phases[invert].draw()
 
 
 class Checkers(HandGrasp):
@@ -56,87 +102,192 @@ class Checkers(HandGrasp):
     def __init__(self, *karg, **kargs):
         super().__init__(*karg, **kargs)
 
-        # for checkers
-        self.rect = psychopy.visual.Rect(self.win, size=(0.2, 0.2), fillColor="white")
+        # for checkers. both phases built once per window, not per flip
+        self.board = self.stim_cache.shared("checkers", lambda: CheckerBoard(self.win))
 
-        # for annotating trial info
-        self.annote = psychopy.visual.TextStim(self.win, text="", name="annotation")
-        self.annote.setColor([-0.8, -0.8, -0.8], "rgb")
-        self.annote.pos = (0.5, -0.8)  # center-right, bottom of screen
-
-        self.block_i = 0
-        self.tr_times = [0, 0]
-        self.block_trs = 0
-        self.block_label = BLOCK_ORDER[0]
-        self.start_pulse_time = 0
+        # reversals. see draw_frame and frame_flipped
+        self.stim_i = 0  # reversals in this block
+        self.reversing = False  # frame being drawn is a reversal
+        self.next_reversal = 0  # when to call flip for the next reversal
+        self.last_reversal = 0
+        self.block_start = 0
 
         # grating_res = 256
         # self.stim = psychopy.visual.RadialStim(win=self.win, units="pix", size=(grating_res, grating_res))
 
-    def draw_annote(self):
-        self.annote.text = f"{self.block_trs}@{self.block_i}={self.block_label} {self.tr_times[0]:0.3f} {self.tr_times[1]:0.3f}"
-        self.annote.draw()
+    def prepare(self):
+        """Pre-render rest text and measure refresh rate (~1 second).
+        Checkers are already built in __init__."""
+        # only rest is shown as text. checkers are drawn directly
+        self.build_cache([REST_TEXT])
+        # reversals are whole frames of the measured refresh rate
+        self.clock = self.stim_cache.shared("clock", lambda: FrameClock(self.win))
+        self.reversal_frames = self.clock.frames(STIM_PER_SEC)
+        # every flip's timing. log gets per block summaries, not a line per reversal
+        self.frames = FrameRing(self.clock.period)
+        self.prepared = True
+
+    def get_ready(self):
+        "Wait for the start pulse. Then blank msgbox"
+        start = super().get_ready()
+        # BUG? why does 'waiting for scanner' text need to be cleared?
+        self.msgbox.text = ""
         self.msgbox.draw()
+        return start
+
+    def draw_frame(self, block_i, label, ntr):
+        """Checkers, reversed when due, or rest text. Annotation on top.
+        @param block_i block index (annotation)
+        @param label   ON_TEXT or REST_TEXT
+        @param ntr     pulses counted toward the block so far (annotation)
+        """
+        is_checkers = label != REST_TEXT
+        # first frame of a block or reversal due
+        self.reversing = is_checkers and (
+            self.stim_i == 0 or psychopy.core.getTime() >= self.next_reversal
+        )
+        if self.reversing:
+            self.stim_i += 1
+        if is_checkers:
+            self.board.draw((self.stim_i - 1) % 2)  # offset/inverted?
+        else:
+            self.stim_cache.draw(REST_TEXT)
+        if self.annote is not None:
+            # pulse and block counters, then block label and TRs
+            self.annote.update(
+                (ntr, block_i),
+                f"{label} {self.tr_times[0]:0.3f} {self.tr_times[1]:0.3f}",
+            )
+            self.annote.draw()
+            self.msgbox.draw()
+
+    def frame_due(self):
+        "Next reversal during checkers. Rest is static."
+        return self.next_reversal if self.block_label != REST_TEXT else None
+
+    def flip_block(self):
+        "Flip the first frame of a block. @return flip timestamp"
+        flip = self.win.flip()
+        self.block_start = flip
+        self.mark_external(f"block {self.block_label}")
+        return flip
+
+    def frame_flipped(self, flip, drawn, new_block):
+        """Track flip timing. Schedule the next reversal.
+        Reversals after the first in a block are due a whole number of frames apart.
+        Others: first vsync after drawing."""
+        expected = None
+        if self.reversing and not new_block:
+            expected = self.last_reversal + self.reversal_frames * self.clock.period
+        self.track_flip(flip, drawn, expected)
+        if self.reversing:
+            self.last_reversal = flip
+            self.next_reversal = self.clock.target(flip, self.reversal_frames)
+            self.mark_event(
+                tracefile.REVERSAL, flip, None,
+                block=self.block_i, pulse=self.pulse_i, phase=(self.stim_i - 1) % 2,
+            )
 
-    def record_event(self, flip_time):
-        self.add_event(
-            onset=flip_time,
-            event_name=self.block_label,
-            start_time=self.start_pulse_time,
+    def block_ended(self, row):
+        "Log reversal rate of a checkers block. Reset reversal count."
+        if self.block_label != REST_TEXT and self.stim_i > 1:
+            hz = (self.stim_i - 1) / (self.last_reversal - self.block_start)
+            self.mark_external(
+                f"block {self.block_label} {self.stim_i} reversals at {hz:0.3f} Hz"
+                + f" (requested {1/STIM_PER_SEC:0.3f} Hz)"
+            )
+        super().block_ended(row)
+        self.stim_i = 0
+        # BUG: like instructions. not sure why this stays on
+        self.msgbox.text = ""
+
+    def mark_pulse(self, t, prev):
+        "Log a scanner pulse. Format parsed by analyze_logs.CHECKER_PULSE_RE"
+        self.mark_event(
+            tracefile.PULSE, t, tracefile.PULSE_MARKS["checkers"], t - prev, t,
+            block=self.block_i, pulse=self.pulse_i + 1,
         )
 
 
-def main(settings):
+def main(settings, win=None, task=None):
     """
     Run the task.
     @param settings dict of parameters from args_to_settings
+    @param win      window to reuse. default: new window per fullscreen setting
+    @param task     prepared task object from new_task, built ahead (see session.py). default: new
+    @return Checkers task object (False if dialog canceled)
     """
+    # imports count only when this run launched the process.
+    # a passed in window or task was set up long before by task_server.py or session.py
+    launched = win is None and task is None
+    timer = StartupTimer(IMPORT_START if launched else None)
+    if launched:
+        timer.phase("imports")
 
     #: dialog's already up if seen, so dont provide option to toggle
     #: logging disableing is only for testing. dont provide option for that (only in CLI params)
-    tweakable = {k: v for k, v in settings.items() if k not in ["no_dialog", "logging"]}
+    #: fast start makes the window before the dialog. can't change fullscreen after
+    hidden = CLI_ONLY + (["fullscreen"] if settings.get("fast_start") else [])
+    tweakable = {k: v for k, v in settings.items() if k not in hidden}
     run_info = RunDialog(
         # ntrials should be nblocks
         extra_dict=tweakable,
         order=["subjid", "ntrials", "ntr", "annotate", "instructions", "fullscreen"],
     )
 
+    hc = task
+    if hc is None and settings.get("fast_start"):
+        hc = new_task(settings, win, Checkers)
+        timer.phase("window")
+        hc.prepare()
+        timer.phase("stimuli")
+        # dialog on top. load post-run modules while operator fills it in
+        hide_window(hc.win)
+        prewarm()
+
     if settings.get("no_dialog"):
         pass  # use whatever defaults we were given
     elif not run_info.dlg_ok():
         return False
+    timer.phase("dialog")
 
-    # pull in new settings
+    # pull in new settings. keep command line only settings
     # make sure types are as expected after editing (as string)
-    settings = run_info.info
+    settings = {**settings, **run_info.info}
     settings["ntrials"] = int(settings["ntrials"])
     settings["ntr"] = int(settings["ntr"])
 
     # and get a participant object for saving files
     participant = run_info.mk_participant(["checkers"])
 
-    # onset_df is typically precomputed.
-    # kludge: will popoulate as we go so output csv file still has data for GLM
-    #         but timing will be determined dynamically/at run time by TR pulses
-    empty_df = pd.DataFrame({"onset": [], "event_name": [], "onset0": []})
-
-    win = None  # let lncdtask figure it out
-    if not settings["fullscreen"]:
-        win = create_window(False)
-    hc = Checkers(onset_df=empty_df, win=win)
+    if hc is None:
+        hc = new_task(settings, win, Checkers)
+        timer.phase("window")
+    else:
+        hide_window(hc.win, False)
 
     # escape quits
     hc.gobal_quit_key()
 
     # record timing to file and to standard out
+    log_path = None
     if settings.get("logging", True):
-        logger = FileLogger()
-        logger.new(participant.log_path("checkers"))
-        hc.externals.append(logger)  # save events "marked" to a file
+        log_path = participant.log_path("checkers")
     else:
         print("WARNING: no logging!")
         print(settings)
-    hc.externals.append(ExternalCom())  # and print to terminal
+    if settings.get("async_log"):
+        # same file and printing, but written by a background thread
+        hc.async_log = AsyncLogger(log_path)
+    else:
+        if log_path:
+            logger = FileLogger()
+            logger.new(log_path)
+            hc.externals.append(logger)  # save events "marked" to a file
+        hc.externals.append(ExternalCom())  # and print to terminal
+    if log_path and settings.get("trace"):
+        path = tracefile.trace_path(log_path)
+        hc.trace = tracefile.TraceWriter(path, psychopy.core.getTime(), hc.events.names)
 
     # instructins include specific generated information:
     # how long an and how many trials
@@ -148,86 +299,53 @@ def main(settings):
     if settings["instructions"]:
         hc.run_instructions(instructions)
 
-    # track two TR times. likely BOLD volume and then VASO volume
-    tr_times = [0, 0]
-    # wait for scanner trigger.
-    # This is pulse is recieved precieding the first volume that's collected
-    hc.start_pulse_time = hc.get_ready()
-    prev_tr = hc.start_pulse_time  # for TR calc. only on first 2 trs
-    hc.mark_external(f"STARTING: recieved first TR pulse {hc.start_pulse_time}")
-    stim_i = 0
-    last_flip = hc.start_pulse_time
-
-    # BUG? why does 'waiting for scanner' text need to be cleared?
-    hc.msgbox.text = ""
-    hc.msgbox.draw()
-
-    is_first = True # first interation of block
-
-    while hc.block_i / len(BLOCK_ORDER) < settings["ntrials"]:
-        # flip screen at sim rate
-        now = psychopy.core.getTime()
-        if hc.block_label != REST_TEXT and now - last_flip >= STIM_PER_SEC:
-            invert = stim_i % 2 # offset/inverted?
-            draw_checkers(hc.rect, invert)
-            stim_i += 1
-
-            if settings.get("annotate"):
-                hc.draw_annote()
-
-            hc.win.flip()
-            last_flip = psychopy.core.getTime()
-            hc.mark_external(f"checkers {invert} {stim_i}")
-
-        elif hc.block_label == REST_TEXT:
-            hc.msgbox.text = REST_TEXT
-            hc.msgbox.height = 0.5
-            hc.msgbox.setColor([1, 1, 1], "rgb")  # white
-            hc.msgbox.draw()
-            if settings.get("annotate"):
-                hc.draw_annote()
-            hc.win.flip()
-            last_flip = psychopy.core.getTime()
-        else:
-            # checkers but not time for checkboard flip
-            pass
-
-        if is_first:
-            hc.record_event(last_flip)
-            hc.mark_external(f"block {hc.block_label}")
-            is_first = False
-
-
-        # track TR recieved
-        keys = psychopy.event.getKeys(keyList=TRIGGERS)
-        if keys:
-            if hc.tr_times[1] == 0:
-                hc.tr_times[hc.block_trs % 2] = now - prev_tr
-            prev_tr = now
-            hc.mark_external(f"pulse {now - prev_tr:-0.3f} ({now:0.4f})")
-            hc.block_trs += 1
-            if hc.block_trs > settings["ntr"]:
-                stim_i = 0
-                is_first = True # for logging first block flip
-
-                hc.block_trs = 0
-                hc.block_i += 1
-                hc.block_label = BLOCK_ORDER[hc.block_i % len(BLOCK_ORDER)]
-
-                # BUG: like instructions. not sure why this stays on
-                hc.msgbox.text = ""
-
+    timer.phase("instructions")
+    if not hc.prepared:
+        hc.prepare()
+        timer.phase("stimuli")
+    if settings.get("annotate"):
+        hc.use_annotation()
+    hc.mark_external(timer.report())
+    hc.mark_external(
+        f"refresh {hc.clock.rate:0.2f} Hz; reversal every {hc.reversal_frames} frames"
+    )
 
-    psychopy.core.wait(tr_times[1])  # wait for last volume to acquire
+    # every block in order: checkers, rest, checkers, ...
+    schedule = [
+        (block_i, BLOCK_ORDER[block_i % len(BLOCK_ORDER)])
+        for block_i in range(settings["ntrials"] * len(BLOCK_ORDER))
+    ]
+    if settings.get("realtime"):
+        hc.use_realtime(settings.get("cpu"))
+    completed = False
+    try:
+        # wait for scanner trigger, then count ntr+1 pulses per block.
+        # the start pulse is not counted
+        hc.run_blocks(schedule, settings["ntr"] + 1, count_start=False)
+        completed = True
+    finally:
+        # also on escape (core.quit ends the process) or an error
+        hc.stop_realtime()
+        if not completed:
+            hc.close_log()  # keep marks queued since the last block boundary
+    psychopy.core.wait(hc.tr_times[1])  # wait for last volume to acquire
     hc.finished("Done!\nThank you!")
 
     # save complete event info.
+    run_csv = None
     if settings.get("logging", True):
-        hc.onset_df.to_csv(
-            participant.run_path(
-                f"checkers_tr1-{hc.tr_times[0]:0.3f}_tr2-{hc.tr_times[1]:0.3f}"
-            )
+        run_csv = participant.run_path(
+            f"checkers_tr1-{hc.tr_times[0]:0.3f}_tr2-{hc.tr_times[1]:0.3f}"
         )
+        hc.save_events(run_csv)
+        hc.save_bids_events(run_csv)
+        if settings.get("frame_dump"):
+            hc.frames.dump(sidecar_path(run_csv, "frames"))
+        if settings.get("design_matrix"):
+            hc.save_design_matrix(run_csv)
+    hc.report_latency(run_csv)
+    hc.close_log()
+    return hc
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Search for an efficient grasp/rest schedule.
+
+gen_timing (grasp_task.py) strictly alternates equal length blocks.
+Here many candidate schedules are drawn with numpy, convolved with a canonical HRF,
+and scored by estimation efficiency of the grasp regressor per scan: 1 / (n c (X'X)^-1 c'),
+each over its own n scans (until its last event ends).
+Raw efficiency grows with the number of scans, so it would mostly pick the longest schedule.
+Batches are scored in a process pool.
+The best is returned in the onset_df format LNCDTask.run uses, plus a 'dur' column.
+
+Two kinds of schedule:
+  * block (default, candidates): order, block durations, and jittered rest
+  * event-related (--isi, event_candidates): short grasp events (--dur)
+    each after a rest of random length (jittered ISI)
+
+  python design.py --ntrials 10 --dur 20 --ncandidates 20000 --out design.csv
+  python design.py --ntrials 30 --dur 2 --isi 4,12 --out events.csv
+"""
+
+import argparse
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DT = 0.1  #: seconds per sample of the high resolution boxcar
+HRF_SECS = 32  #: length of the sampled HRF
+DEFAULT_TR = 1.024  #: seconds per volume of one contrast (BOLD 0.576 + VASO 0.448)
+DUR_SCALE = (0.75, 1, 1.25)  #: block durations are these times --dur
+BATCH = 500  #: candidates scored at once per process
+EVENT_NAMES = ("rest", "grasp")  #: condition code -> event_name
+
+
+def hrf(t, peak=6, undershoot=16, ratio=1 / 6):
+    """Canonical double gamma HRF (SPM shape) at times t (seconds). Peak normalized to 1.
+    >>> h = hrf(np.arange(0, 32, 0.1))
+    >>> round(float(h.max()), 3), bool(4.5 < np.argmax(h) * 0.1 < 5.5)
+    (1.0, True)
+    """
+    t = np.asarray(t, dtype=float)
+    tp = np.clip(t, 0, None)
+    resp = tp ** (peak - 1) * np.exp(-tp) / math.gamma(peak)
+    resp -= ratio * tp ** (undershoot - 1) * np.exp(-tp) / math.gamma(undershoot)
+    resp[t < 0] = 0
+    return resp / resp.max()
+
+
+def candidates(rng, ncand, ntrials, durs, jitter=0):
+    """Random schedules with ntrials of each condition.
+    Rest blocks are extended by up to jitter seconds.
+    @param rng    numpy Generator
+    @param ncand  number of schedules
+    @param ntrials blocks of each condition
+    @param durs   block durations to pick from (seconds)
+    @param jitter max extra rest (seconds)
+    @return conds, onsets, durations. each (ncand, 2*ntrials)
+    """
+    nev = 2 * ntrials
+    conds = rng.permuted(np.tile(np.arange(2), (ncand, ntrials)), axis=1)
+    dur = rng.choice(np.asarray(durs, dtype=float), size=(ncand, nev))
+    dur += (conds == 0) * rng.uniform(0, jitter, size=(ncand, nev))
+    onsets = np.cumsum(dur, axis=1) - dur
+    return conds, onsets, dur
+
+
+def event_candidates(rng, ncand, ntrials, durs, isi):
+    """Random event-related schedules: rest of random length (ISI) then a short grasp,
+    ntrials times.
+    @param rng     numpy Generator
+    @param ncand   number of schedules
+    @param ntrials grasp events
+    @param durs    event durations to pick from (seconds)
+    @param isi     (min, max) rest before each event (seconds). uniform
+    @return conds, onsets, durations. each (ncand, 2*ntrials)
+    """
+    nev = 2 * ntrials
+    conds = np.tile(np.arange(2), (ncand, ntrials))
+    event = rng.choice(np.asarray(durs, dtype=float), size=(ncand, nev))
+    rest = rng.uniform(isi[0], isi[1], size=(ncand, nev))
+    dur = np.where(conds == 1, event, rest)
+    onsets = np.cumsum(dur, axis=1) - dur
+    return conds, onsets, dur
+
+
+def regressors(conds, onsets, dur, times, cond=1):
+    """HRF convolved boxcar of one condition sampled at times.
+    @param conds,onsets,dur (ncand, nevents) from candidates
+    @param times  sample times (seconds). eg volume acquisitions
+    @param cond   condition code to model
+    @return (ncand, len(times))
+    """
+    ncand = conds.shape[0]
+    nt = int(math.ceil(max(np.max(onsets + dur), np.max(times)) / DT)) + 1
+    # boxcar from +1 at block start, -1 at block end, then cumsum
+    delta = np.zeros((ncand, nt + 1))
+    rows = np.repeat(np.arange(ncand), conds.shape[1])
+    weight = (conds == cond).ravel().astype(float)
+    np.add.at(delta, (rows, np.round(onsets / DT).astype(int).ravel()), weight)
+    np.add.at(delta, (rows, np.round((onsets + dur) / DT).astype(int).ravel()), -weight)
+    box = np.cumsum(delta, axis=1)[:, :nt]
+
+    kernel = hrf(np.arange(0, HRF_SECS, DT))
+    n = nt + len(kernel) - 1
+    conv = np.fft.irfft(np.fft.rfft(box, n) * np.fft.rfft(kernel, n), n)[:, :nt]
+    return conv[:, np.round(np.asarray(times) / DT).astype(int)]
+
+
+def event_regressors(codes, onsets, dur, ncodes, times):
+    """HRF convolved regressor for each event type of one recorded run.
+    All types are convolved at once (one row per type, as if candidates).
+    @param codes  event type code of each event (0..ncodes-1)
+    @param onsets event onsets (seconds from first pulse)
+    @param dur    event durations (seconds)
+    @param times  sample times. eg each volume's pulse
+    @return (len(times), ncodes)
+    """
+    codes = np.asarray(codes)
+    conds = (codes[None, :] == np.arange(ncodes)[:, None]).astype(int)
+    tile = lambda x: np.tile(np.asarray(x, dtype=float), (ncodes, 1))
+    return regressors(conds, tile(onsets), tile(dur), times).T
+
+
+def efficiency(conds, onsets, dur, tr=DEFAULT_TR):
+    """Estimation efficiency of grasp vs rest per scan for each candidate.
+    Design matrix is [grasp regressor, intercept, linear drift] sampled every tr
+    until that candidate's last event ends: a candidate scores the same
+    whatever else is in the batch. The drift term keeps very long blocks
+    (slow, scanner drift like signal) from scoring as well as alternation.
+    Dividing by the candidate's scans compares schedules of different lengths
+    on design, not on how long they run.
+    @return (ncand,) larger is better
+    """
+    ends = np.max(onsets + dur, axis=1)
+    times = np.arange(int(math.ceil(ends.max() / tr))) * tr
+    reg = regressors(conds, onsets, dur, times)
+    drift = times[None, :] / ends[:, None] - 0.5  # -.5 to .5 over each candidate
+    X = np.stack([reg, np.ones_like(reg), drift], axis=2)
+    scanned = (times[None, :] < ends[:, None]).astype(float)  # (ncand, nscan)
+    xtx = np.einsum("ct,cti,ctj->cij", scanned, X, X)
+    contrast = np.array([1.0, 0.0, 0.0])
+    var = np.einsum("i,cij,j->c", contrast, np.linalg.inv(xtx), contrast)
+    return 1 / (var * scanned.sum(axis=1))
+
+
+def _score_batch(job):
+    "Best of one batch. Runs in a worker process."
+    seed, ncand, ntrials, durs, jitter, isi, tr = job
+    rng = np.random.default_rng(seed)
+    if isi is None:
+        conds, onsets, dur = candidates(rng, ncand, ntrials, durs, jitter)
+    else:
+        conds, onsets, dur = event_candidates(rng, ncand, ntrials, durs, isi)
+    eff = efficiency(conds, onsets, dur, tr)
+    best = int(np.argmax(eff))
+    return eff[best], conds[best], onsets[best], dur[best]
+
+
+def to_onset_df(conds, onsets, dur):
+    """One schedule as onset_df: event_name, onset, dur.
+    >>> to_onset_df(np.array([0, 1]), np.array([0., 20.]), np.array([20., 20.])).event_name.tolist()
+    ['rest', 'grasp']
+    """
+    import pandas as pd
+
+    return pd.DataFrame(
+        {"event_name": [EVENT_NAMES[c] for c in conds], "onset": onsets, "dur": dur}
+    )
+
+
+def search(
+    ncandidates, ntrials, durs, jitter=0, tr=DEFAULT_TR, seed=None, workers=None, isi=None
+):
+    """Score ncandidates schedules in a process pool and keep the most efficient.
+    Fewer than two batches are scored in this process.
+    @param durs    block durations. event durations with isi
+    @param jitter  max extra rest per block (block schedules)
+    @param workers processes. default os.cpu_count()
+    @param isi     (min, max) seconds: event-related schedules. default blocks
+    @return (onset_df, efficiency)
+    """
+    nbatch = max(1, math.ceil(ncandidates / BATCH))
+    seeds = np.random.SeedSequence(seed).spawn(nbatch)
+    sizes = [BATCH] * (nbatch - 1) + [ncandidates - BATCH * (nbatch - 1)]
+    isi = tuple(isi) if isi is not None else None
+    jobs = [(s, n, ntrials, tuple(durs), jitter, isi, tr) for s, n in zip(seeds, sizes)]
+    if nbatch == 1:
+        results = [_score_batch(jobs[0])]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_score_batch, jobs))
+    eff, conds, onsets, dur = max(results, key=lambda r: r[0])
+    return to_onset_df(conds, onsets, dur), float(eff)
+
+
+def alternating_efficiency(ntrials, block_dur, tr=DEFAULT_TR):
+    "Efficiency per scan of gen_timing's strict rest/grasp alternation, for comparison."
+    conds = np.tile(np.arange(2), ntrials)[None, :]
+    dur = np.full(conds.shape, float(block_dur))
+    onsets = np.cumsum(dur, axis=1) - dur
+    return float(efficiency(conds, onsets, dur, tr)[0])
+
+
+def isi_arg(text):
+    """Parse --isi.
+    >>> isi_arg("4,12")
+    (4.0, 12.0)
+    """
+    low, high = (float(x) for x in text.split(","))
+    return low, high
+
+
+def design_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Efficient grasp/rest schedule search")
+    parser.add_argument("--ntrials", type=int, default=10, help="blocks (or events) of each condition")
+    parser.add_argument("--dur", type=float, default=20, help="typical block (or event) duration (s)")
+    parser.add_argument("--jitter", type=float, default=0, help="max extra rest (s). blocks only")
+    parser.add_argument(
+        "--isi",
+        type=isi_arg,
+        default=None,
+        metavar="MIN,MAX",
+        help="event-related: rest before each event drawn from MIN to MAX seconds",
+    )
+    parser.add_argument("--tr", type=float, default=DEFAULT_TR, help="seconds per volume")
+    parser.add_argument("--ncandidates", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="csv. default print")
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = design_args(in_args)
+    durs = [args.dur * s for s in DUR_SCALE]
+    onset_df, eff = search(
+        args.ncandidates, args.ntrials, durs, args.jitter, args.tr, args.seed, isi=args.isi
+    )
+    secs = onset_df.onset.iloc[-1] + onset_df.dur.iloc[-1]
+    if args.isi is None:
+        base = alternating_efficiency(args.ntrials, args.dur, args.tr)
+        alt_secs = 2 * args.ntrials * args.dur
+        print(f"efficiency per scan {eff:0.4f} {secs:0.0f}s (alternating {base:0.4f} {alt_secs:0.0f}s)")
+    else:
+        print(f"efficiency per scan {eff:0.4f} {secs:0.0f}s")
+    if args.out:
+        onset_df.to_csv(args.out, index=False)
+    else:
+        print(onset_df.to_string())
+    return onset_df
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+"""
+Preallocated columnar event record.
+
+pd.concat on every event copies the whole DataFrame each time (quadratic)
+and allocates pandas objects between TR pulses.
+Here an event is a handful of numpy scalar assignments.
+The DataFrame is built once, after the run.
+"""
+
+import numpy as np
+
+CHUNK = 256  #: initial rows. capacity doubles when full
+
+#: column name -> dtype. event_name is stored as code into EventBuffer.names
+FIELDS = {
+    "onset": np.float64,
+    "event_name": np.int16,
+    "onset0": np.float64,
+    "pulse": np.int32,
+    "block": np.int32,
+    "dropped": np.int32,
+}
+
+
+class EventBuffer:
+    """
+    Growable numpy columns, one row per event.
+    Columns mirror onset_df (onset, event_name, onset0)
+    plus pulse and block index and frames dropped during the event
+    (-1 when not applicable or not measured).
+    """
+
+    def __init__(self, chunk=CHUNK):
+        self.n = 0  #: rows used
+        self.names = []  #: event_name code -> text
+        self._codes = {}  # text -> code
+        self.cols = {k: np.empty(chunk, dtype=t) for k, t in FIELDS.items()}
+
+    def __len__(self):
+        return self.n
+
+    def code(self, event_name):
+        "Integer code for event_name. New names are appended."
+        code = self._codes.get(event_name)
+        if code is None:
+            code = self._codes[event_name] = len(self.names)
+            self.names.append(event_name)
+        return code
+
+    def _grow(self):
+        "Double capacity. Rare: amortized cost per event stays constant."
+        for k, col in self.cols.items():
+            bigger = np.empty(2 * len(col), dtype=col.dtype)
+            bigger[: self.n] = col[: self.n]
+            self.cols[k] = bigger
+
+    def add(self, onset, event_name, onset0, pulse=-1, block=-1):
+        """Record one event.
+        @param onset      psychopy time of event (flip)
+        @param event_name text of event. stored as integer code
+        @param onset0     onset relative to first TR pulse
+        @param pulse      index of TR pulse that started event
+        @param block      block index
+        @return row index
+        """
+        i = self.n
+        if i == len(self.cols["onset"]):
+            self._grow()
+        cols = self.cols
+        cols["onset"][i] = onset
+        cols["event_name"][i] = self.code(event_name)
+        cols["onset0"][i] = onset0
+        cols["pulse"][i] = pulse
+        cols["block"][i] = block
+        cols["dropped"][i] = -1
+        self.n = i + 1
+        return i
+
+    def set(self, row, field, value):
+        "Fill in a field known only later (eg dropped at block end)."
+        self.cols[field][row] = value
+
+    def to_df(self):
+        "DataFrame of used rows. event_name codes converted back to text."
+        import pandas as pd
+
+        data = {k: col[: self.n] for k, col in self.cols.items()}
+        data["event_name"] = np.array(self.names, dtype=object)[data["event_name"]]
+        return pd.DataFrame(data)
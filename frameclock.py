@@ -0,0 +1,163 @@
+"""
+Frame (vsync) locked scheduling.
+
+Flip timestamps land on vsync. Scheduling the next flip as a whole number
+of frames after a previous flip does not drift the way wall clock
+intervals (now - last_flip >= secs) do.
+
+wait_until sleeps toward a deadline and busy waits only the last few milliseconds.
+FrameRing keeps recent flip timing and per-block aggregates (including dropped
+frames: vsyncs missed before a flip) in constant memory.
+"""
+
+import math
+import time
+import numpy as np
+import psychopy.core
+
+DEFAULT_FRAME_RATE = 60  #: Hz. used when refresh rate can't be measured
+SPIN_SECS = 0.003  #: busy wait this close to a deadline. covers sleep granularity
+NAP_SECS = 0.005  #: longest sleep between polls while far from a deadline
+RING_SIZE = 4096  #: flips kept by FrameRing. ~70s at 60Hz of every frame
+VSYNC_SLOP = 0.05  #: frames. flip timestamps land a little after the vsync itself
+
+
+class FrameClock:
+    """
+    Measured refresh period and whole-frame targets.
+    """
+
+    def __init__(self, win, frame_rate=None):
+        """
+        @param win        window to measure. measuring flips ~1 second
+        @param frame_rate skip measuring and use this refresh rate (Hz)
+        """
+        if frame_rate is None:
+            frame_rate = win.getActualFrameRate() or DEFAULT_FRAME_RATE
+        self.rate = frame_rate
+        self.period = 1 / frame_rate
+
+    def frames(self, secs):
+        "Whole number of frames closest to secs. At least 1."
+        return max(1, round(secs / self.period))
+
+    def target(self, last_flip, nframes):
+        """When to call flip so it lands nframes after last_flip.
+        Half a frame early: flip blocks until the vsync itself.
+        @param last_flip timestamp returned by win.flip()
+        @param nframes   frames between last_flip and the next flip
+        """
+        return last_flip + (nframes - 0.5) * self.period
+
+
+def frames_late(flip, drawn, period):
+    """Vsyncs missed between drawing finished and the flip.
+    On time, the flip lands on the first vsync after drawn: anywhere up to one period later.
+    Missing it lands one period after that, however early in the frame drawing finished.
+    >>> p = 1 / 60
+    >>> frames_late(10 * p, 9.1 * p, p), frames_late(11 * p, 9.1 * p, p), frames_late(11 * p, 9.9 * p, p)
+    (0, 1, 1)
+    """
+    return max(0, math.ceil((flip - drawn) / period - 1 - VSYNC_SLOP))
+
+
+def wait_until(deadline, poll=None, spin=SPIN_SECS):
+    """Hybrid wait: short sleeps until `spin` seconds before deadline, then spin.
+    poll() runs between sleeps (eg to check escape and scanner pulses),
+    but not while spinning.
+    @param deadline psychopy.core.getTime() to wait for
+    @param poll     optional function called at most every NAP_SECS
+    @param spin     seconds before deadline to stop sleeping
+    @return seconds past deadline when the wait ended (overshoot)
+    """
+    while True:
+        left = deadline - psychopy.core.getTime()
+        if left <= spin:
+            break
+        if poll is not None:
+            poll()
+        time.sleep(min(left - spin, NAP_SECS))
+    while (now := psychopy.core.getTime()) < deadline:
+        pass
+    return now - deadline
+
+
+class FrameRing:
+    """
+    Last `size` flips (time, interval since previous flip, dropped frames) in fixed
+    numpy arrays, plus running aggregates since block_reset(): count, mean and max
+    interval, late flips, dropped frames. Memory stays the same however long the run.
+    """
+
+    def __init__(self, period, size=RING_SIZE):
+        """
+        @param period measured refresh period (seconds). see FrameClock
+        @param size   flips kept for dump()
+        """
+        self.period = period
+        self.size = size
+        self.flip = np.zeros(size)
+        self.interval = np.full(size, np.nan)
+        self.dropped = np.zeros(size, dtype=np.int16)
+        self.total = 0  # flips ever added
+        self.last = None  # previous flip time
+        self.block_reset()
+
+    def block_reset(self):
+        "Start new aggregates (eg at a block boundary). Ring is kept."
+        self.n = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.nlate = 0  # flips after their vsync
+        self.ndropped = 0  # vsyncs missed
+
+    def add(self, flip, expected=None, drawn=None):
+        """Record a flip. Classified by whole frames after the vsync it was meant for.
+        @param flip     timestamp returned by win.flip()
+        @param expected the scheduled vsync (frame locked flips)
+        @param drawn    drawing finished. without expected, due on the first vsync after it (frames_late)
+                        None for both: not classified
+        @return frames dropped before this flip. 0 is on time
+        """
+        i = self.total % self.size
+        interval = np.nan if self.last is None else flip - self.last
+        dropped = 0
+        if expected is not None:
+            dropped = max(0, round((flip - expected) / self.period))
+        elif drawn is not None:
+            dropped = frames_late(flip, drawn, self.period)
+        self.flip[i] = flip
+        self.interval[i] = interval
+        self.dropped[i] = dropped
+        self.total += 1
+        self.last = flip
+
+        if not np.isnan(interval):
+            self.n += 1
+            self.sum += interval
+            self.max = max(self.max, interval)
+        self.nlate += dropped > 0
+        self.ndropped += dropped
+        return dropped
+
+    def summary(self):
+        """Aggregates since block_reset in milliseconds.
+        >>> ring = FrameRing(0.01)
+        >>> for t in (0, .02, .04, .07): _ = ring.add(t, expected=t if t < .07 else .05)
+        >>> ring.summary()
+        'n=3 mean=23.33 max=30.00 ms late=1 dropped=2'
+        """
+        mean = self.sum / self.n if self.n else 0
+        return (
+            f"n={self.n} mean={mean*1000:0.2f} max={self.max*1000:0.2f} ms"
+            f" late={self.nlate} dropped={self.ndropped}"
+        )
+
+    def dump(self, path):
+        """Write kept flips, oldest first, as csv: flip, interval, dropped.
+        @return number of rows
+        """
+        order = np.arange(self.total - min(self.total, self.size), self.total) % self.size
+        rows = np.column_stack([self.flip[order], self.interval[order], self.dropped[order]])
+        np.savetxt(path, rows, delimiter=",", fmt="%0.6f", header="flip,interval,dropped", comments="")
+        return len(order)
@@ -11,28 +11,22 @@
 
 import argparse
 import sys
-import psychopy
-import lncdtask
+import time
+import numpy as np
 from lncdtask.lncdtask import LNCDTask, RunDialog, FileLogger, ExternalCom
 import pandas as pd
+from triggers import KeyboardTriggers, TRIGGER_SETTINGS, add_trigger_args, make_triggers
+from frameclock import FrameClock, wait_until
+from stimcache import for_window
+import design
 
 REST_TEXT = "Relax"   #: text displayed during rest/relax block
 CLASP_TEXT = "Grasp"  #: text displayed in make a fist block
 DEFAULT_NTRIAL = 1 # number of rest+graps: 10 of each
 DEFAULT_DUR = 1 # seconds, 20 of rest, 20 of grasp"
 TRIGGERS = ["equal"]  #: what key advances the get ready screen?
-
-
-# monkey patch
-def wait_until_monkey(stoptime):
-    """copy of lncdtask.screen.wait_util but with key handing"""
-    while psychopy.core.getTime() < stoptime:
-        print("WAIT")
-        psychopy.event.getKeys(clear=False)
-        psychopy.core.wait(1.001)
-
-# TODO: doesn't work
-lncdtask.lncdtask.wait_util = wait_until_monkey
+#: settings only from command line. not shown in RunDialog but kept after it
+CLI_ONLY = ["no_dialog", "logging", "design", "ncandidates"] + TRIGGER_SETTINGS
 
 
 class HandGrasp(LNCDTask):
@@ -41,10 +35,82 @@ class HandGrasp(LNCDTask):
     Actual text pulled from onset_df
     """
 
-    def __init__(self, *karg, **kargs):
+    def __init__(self, *karg, triggers=None, **kargs):
         super().__init__(*karg, **kargs)
         self.add_event_type("grasp", self.grasp, ["onset", "text"])
         self.add_event_type("rest", self.rest, ["onset", "text"])
+        # scanner pulses with keypress (not poll) timestamps
+        if triggers is None:
+            triggers = KeyboardTriggers(TRIGGERS)
+        self.triggers = triggers
+        self.npulses = 0  # scanner pulses after the start pulse. see poll_triggers
+        self.overshoot = []  # (msg, wait, flip) seconds late. see flip_at
+        self.clock = None  # FrameClock. flips scheduled by frame count when set
+        self.anchor = None  # (onset, flip time) of first event. frame 0
+        self.flips = []  # flip time of each event, in order
+        self.loop_times = None  # (wall, cpu) seconds of run(). see bench_timing.py
+
+    def poll_triggers(self):
+        """Log scanner pulses (and check escape, see triggers.py) while waiting.
+        Runs between sleeps, not in the final busy wait before a flip.
+        Same format as grasp_trcount (see analyze_logs.PULSE_RE). block is the event on screen
+        """
+        for pulse in self.triggers.poll():
+            self.npulses += 1
+            block = max(len(self.flips) - 1, 0)
+            self.mark_external(f"Pulse {self.npulses} for block {block} recieved {pulse}")
+
+    def flip_at(self, onset, msg, *args, **kwargs):
+        """Wait with frameclock.wait_until, then lncdtask's flip_at.
+        lncdtask's own wait finds the deadline already passed and flips immediately.
+        With a clock, events after the first are scheduled as whole frames
+        after the first event's flip (onsets from frame_timeline are whole frames apart).
+        @param onset psychopy.core.getTime() to flip at
+        @param msg   forwarded to marks (file log)
+        @return lncdtask's flip info plus 'overshoot': flip - intended flip time
+        """
+        deadline = intended = onset
+        if self.clock is not None and self.anchor is not None:
+            first_onset, first_flip = self.anchor
+            nframes = round((onset - first_onset) / self.clock.period)
+            deadline = self.clock.target(first_flip, nframes)
+            intended = first_flip + nframes * self.clock.period
+
+        waited = wait_until(deadline, self.poll_triggers)
+        flip = super().flip_at(deadline, msg, *args, **kwargs)
+        flip_time = flip.get("flip", deadline)
+        if self.anchor is None:
+            self.anchor = (onset, flip_time)
+        self.flips.append(flip_time)
+        late = flip_time - intended
+        self.overshoot.append((msg, waited, late))
+        self.mark_external(f"{msg} overshoot {late*1000:0.2f} ms (wait {waited*1000:0.2f} ms)")
+        return {**flip, "overshoot": late}
+
+    def report_overshoot(self):
+        "Log median and worst flip overshoot for the run."
+        if not self.overshoot:
+            return
+        late_ms = np.array([late for _, _, late in self.overshoot]) * 1000
+        self.mark_external(
+            f"overshoot n={len(late_ms)} p50={np.median(late_ms):0.2f}"
+            f" max={late_ms.max():0.2f} ms"
+        )
+
+    def timeline(self):
+        """onset_df with what happened: 'onset_actual' (flip times from the run start
+        LNCDTask.run adds 'onset' to) and 'flip_err' (onset_actual - onset).
+        The first event's flip_err includes the delay from run start to its flip.
+        Unchanged if the run did not flip every event.
+        """
+        timeline = self.onset_df.copy()
+        if len(self.flips) != timeline.shape[0]:
+            return timeline
+        # flip_at gets run start + onset. the first event's gives the run start
+        run_start = self.anchor[0] - timeline.onset.iloc[0]
+        timeline["onset_actual"] = np.array(self.flips) - run_start
+        timeline["flip_err"] = timeline.onset_actual - timeline.onset
+        return timeline
 
     def rest(self, onset, msg):
         """Show grasp/relax text at specified time.
@@ -88,17 +154,25 @@ class HandGrasp(LNCDTask):
         self.win.flip()
         self.win.color = prev_bgcolor
         # ^ likely last flip don't need to change back. safer
+        if self.triggers.simulated:
+            # unattended. show but don't wait for a keypress
+            self.msgbox.text = msg
+            self.msgbox.draw()
+            self.win.flip()
+            return None
         # v likewise, return value likely doesn't matter
         return self.msg(msg)
 
-    def get_ready(self, triggers=TRIGGERS):
+    def get_ready(self):
         """Wait for scanner trigger.
-        TODO: add to lncdtask. see screen.wait_for_scanner()"""
+        TODO: add to lncdtask. see screen.wait_for_scanner()
+        @return timestamp of first pulse"""
         print("Waiting for scanner")
+        self.triggers.clear()  # ignore = pushed before now
         self.msgbox.text = "Waiting for Scanner to start"
         self.msgbox.draw()
         self.win.flip()
-        psychopy.event.waitKeys(keyList=triggers)
+        return self.triggers.wait()
  
 
 
@@ -127,9 +201,56 @@ def gen_timing(n, dur):
     return pd.DataFrame(event_list)
 
 
-def args_to_settings():
+def design_timing(n, dur, ncandidates):
+    """
+    Like gen_timing, but order and block lengths (around dur) chosen
+    by GLM efficiency per scan from ncandidates random schedules. see design.py
+    Strict alternation is kept when no candidate beats it.
+    Adds 'dur' column: each block's length.
+    """
+    durs = [dur * scale for scale in design.DUR_SCALE]
+    onset_df, eff = design.search(ncandidates, n, durs)
+    base = design.alternating_efficiency(n, dur)
+    secs = onset_df.onset.iloc[-1] + onset_df.dur.iloc[-1]
+    print(
+        f"design efficiency per scan {eff:0.4f} {secs:0.0f}s"
+        f" (alternating {base:0.4f} {2 * n * dur:0.0f}s)"
+    )
+    if eff <= base:
+        print("keeping alternation")
+        onset_df = gen_timing(n, dur)
+        onset_df["dur"] = float(dur)
+        return onset_df
+    text = {"rest": REST_TEXT, "grasp": CLASP_TEXT}
+    onset_df["text"] = onset_df.event_name.map(text)
+    return onset_df
+
+
+def frame_timeline(onset_df, clock):
+    """
+    Compile onsets (seconds) to whole frames of the measured refresh.
+    Adds 'frame' (frames after first event), 'onset_intended' (input onset),
+    and 'quant_err' (seconds). 'onset' becomes the frame aligned time.
+    >>> from types import SimpleNamespace
+    >>> d = frame_timeline(gen_timing(1, 1.01), SimpleNamespace(period=0.1))
+    >>> d.frame.tolist()
+    [0, 10]
+    >>> round(d.quant_err[1], 3)
+    -0.01
+    """
+    timeline = onset_df.copy()
+    first = timeline.onset.iloc[0]
+    timeline["onset_intended"] = timeline.onset
+    timeline["frame"] = np.round((timeline.onset - first) / clock.period).astype(int)
+    timeline["onset"] = first + timeline.frame * clock.period
+    timeline["quant_err"] = timeline.onset - timeline.onset_intended
+    return timeline
+
+
+def args_to_settings(in_args=None):
     """
     Command line args to make it a little easier to speed run testing.
+    @param in_args inputs for arg.parser. default sys.argv
     """
 
     parser = argparse.ArgumentParser(description="Hand Grasp Task")
@@ -138,49 +259,98 @@ def args_to_settings():
     parser.add_argument("--dur", type=float, default=DEFAULT_DUR, help="Duration of each block in seconds")
     parser.add_argument("--no-instructions", default=False, action="store_true", dest="instructions",
                         help="Skip instructions at the beginning of the task")
-    args = parser.parse_args()
+    parser.add_argument("--no-dialog", default=False, action="store_true", dest="no_dialog",
+                        help="Disable dialog popup. Use command line args instead.")
+    parser.add_argument("--no-logging", default=True, action="store_false", dest="logging",
+                        help="Do not save log or csv. For testing.")
+    parser.add_argument("--design", default=False, action="store_true", dest="design",
+                        help="Search for an efficient block order and lengths (see design.py)")
+    parser.add_argument("--ncandidates", type=int, default=5000,
+                        help="Schedules to score with --design")
+    add_trigger_args(parser)
+    args = parser.parse_args(in_args)
 
     settings = {'subjid': args.subjid,
                 'ntrials': args.ntrials,
                 'dur': args.dur,
-                'instructions': args.instructions}
+                'instructions': args.instructions,
+                'no_dialog': args.no_dialog,
+                'logging': args.logging,
+                'design': args.design,
+                'ncandidates': args.ncandidates,
+                **{k: getattr(args, k) for k in TRIGGER_SETTINGS}}
     return settings
 
 
-def main():
+def run_dialog(settings):
+    "RunDialog for settings not in CLI_ONLY. Only shown by dlg_ok()"
+    tweakable = {k: v for k, v in settings.items() if k not in CLI_ONLY}
+    return RunDialog(
+            extra_dict=tweakable,
+            order=['subjid', 'ntrials', 'dur', 'instructions'])
+
+
+def new_task(settings, win=None, participant=None):
+    """Task object with its schedule compiled to frames of the window's refresh.
+    Slow with --design (schedule search) or on a new window (refresh measured).
+    @param settings    dict from args_to_settings, after any dialog
+    @param win         window to reuse. default: lncdtask makes one
+    @param participant for log and csv paths. default: from settings without a dialog
+    """
+    if participant is None:
+        participant = run_dialog(settings).mk_participant(['grasp'])
+
+    # use settings to pre-construct full timing schedule of task events
+    if settings.get('design'):
+        onset_df = design_timing(settings['ntrials'], settings['dur'], settings['ncandidates'])
+    else:
+        onset_df = gen_timing(settings['ntrials'], settings['dur'])
+
+    hc = HandGrasp(onset_df=onset_df, participant=participant, win=win,
+                   triggers=make_triggers(TRIGGERS, settings))
+    hc.participant = participant  # main uses it for log and csv paths
+    # flips by frame count. refresh measured once per window (see task_server.py)
+    hc.clock = for_window(hc.win).shared("clock", lambda: FrameClock(hc.win))
+    hc.onset_df = frame_timeline(hc.onset_df, hc.clock)
+    return hc
+
+
+def main(settings, win=None, task=None):
     """
     Run the task.
+    @param settings dict of parameters from args_to_settings
+    @param win      window to reuse. default: lncdtask makes one
+    @param task     from new_task(settings, win), built ahead (see session.py). default: new
+    @return HandGrasp task object
     """
 
-    settings = args_to_settings()
-
-    run_info = RunDialog(
-            extra_dict=settings,
-            order=['subjid', 'ntrials', 'dur', 'instructions'])
+    run_info = run_dialog(settings)
 
-    if not run_info.dlg_ok():
+    if settings.get('no_dialog'):
+        pass  # use whatever defaults we were given
+    elif not run_info.dlg_ok():
         return
 
-    # pull in new settings
+    # pull in new settings. keep command line only settings
     # make sure types are as expected after editing (as string)
-    settings = run_info.info
+    settings = {**settings, **run_info.info}
     settings['ntrials'] = int(settings['ntrials'])
     settings['dur'] = float(settings['dur'])
 
-    # use settings to pre-construct full timing schedule of task events
-    onset_df = gen_timing(settings['ntrials'], settings['dur'])
-
-    # and get a participant object for saving files
-    participant = run_info.mk_participant(['grasp'])
-
-    hc = HandGrasp(onset_df=onset_df, participant=participant)
+    hc = task
+    if hc is None:
+        # and get a participant object for saving files
+        hc = new_task(settings, win, run_info.mk_participant(['grasp']))
+    participant = hc.participant
+    onset_df = hc.onset_df
     # escape quits
     hc.gobal_quit_key()
 
     # record timing to file and to standard out
-    logger = FileLogger()
-    logger.new(participant.log_path('subj_info'))
-    hc.externals.append(logger)
+    if settings.get('logging'):
+        logger = FileLogger()
+        logger.new(participant.log_path('subj_info'))
+        hc.externals.append(logger)
     hc.externals.append(ExternalCom())
 
     # instructins include specific generated information:
@@ -212,15 +382,22 @@ def main():
     # ### START TASK ###
 
     # wait for scanner trigger
-    hc.get_ready()
+    start_pulse_time = hc.get_ready()
+    hc.mark_external(f"STARTING: recieved first TR pulse {start_pulse_time}")
     # need to wait for last block to end
-    hc.run(end_wait=settings['dur'])
+    loop_start = (time.perf_counter(), time.process_time())
+    hc.run(end_wait=onset_df.dur.iloc[-1] if 'dur' in onset_df else settings['dur'])
+    hc.loop_times = (time.perf_counter() - loop_start[0], time.process_time() - loop_start[1])
+    hc.report_overshoot()
     hc.finished("Done!\nThank you!")
 
     # save complete event info.
     # includes run order expected and exact flip times
-    hc.onset_df.to_csv(participant.run_path('subj_info'))
+    if settings.get('logging'):
+        hc.timeline().to_csv(participant.run_path('subj_info'))
+    return hc
 
 
 if __name__ == "__main__":
-    main()
+    settings = args_to_settings(sys.argv[1:])
+    main(settings)
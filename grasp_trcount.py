@@ -9,22 +9,45 @@
 # lncdtask = { git = "https://github.com/LabNeuroCogDevel/lncdtask" }
 # ///
 
+import time
+
+IMPORT_START = time.perf_counter()  #: launch time for startup timing
+
 import argparse
+import collections
 import sys
+import numpy as np
 import psychopy
 import lncdtask
 from lncdtask.lncdtask import LNCDTask, RunDialog, FileLogger, ExternalCom, create_window
-import pandas as pd
+from startup import StartupTimer, hide_window, prewarm
+from stimcache import for_window
+from annotation import Annotation
+from eventbuffer import EventBuffer
+from asynclog import AsyncLogger
+from latency import LatencyRecorder, sidecar_path
+import design
+import bids_events
+import tracefile
+from frameclock import FrameClock, FrameRing, DEFAULT_FRAME_RATE
+from realtime import RealtimeMode
+from triggers import KeyboardTriggers, TRIGGER_SETTINGS, add_trigger_args, make_triggers
 
 REST_TEXT = "Relax"  #: text displayed during rest/relax block
 GRASP_TEXT = "Grasp"  #: text displayed in make a fist block
 BLOCK_ORDER = (REST_TEXT, GRASP_TEXT)  #: sequence
+WAIT_TEXT = "Waiting for Scanner to start"  #: shown until first TR pulse
 DEFAULT_NTRIAL = 1  #: number of rest+graps pairs. NTRIAL of each.
 DEFAULT_NTR = 4  #: number of counted pulses per individual block
 #: NB. VESO sequence has pulse for VESO and BOLD. 2 pulses per repetition
 TRIGGERS = [
     "equal"
 ]  #: what key advances the get ready screen? TTL to key via button box
+#: settings only from command line. not shown in RunDialog but kept after it
+CLI_ONLY = ["no_dialog", "logging", "async_log", "predict", "fast_start", "design_matrix", "trace", "frame_dump", "frame_stats", "realtime", "cpu"]
+CLI_ONLY += TRIGGER_SETTINGS
+PREDRAW_LEAD = 0.05  #: --predict draws next block this many seconds before its pulse
+PREDICT_TOLERANCE = 0.05  #: pulse this far from expected is logged as early/late
 
 
 class HandGrasp(LNCDTask):
@@ -33,27 +56,279 @@ class HandGrasp(LNCDTask):
     Actual text pulled from onset_df
     """
 
-    def __init__(self, *karg, **kargs):
+    def __init__(self, *karg, triggers=None, **kargs):
+        """
+        @param triggers pulse source. default KeyboardTriggers. see triggers.make_triggers
+        """
         super().__init__(*karg, **kargs)
-        # annotation for sequence info
-        self.annote = psychopy.visual.TextStim(self.win, text="", name="annotation")
-        self.annote.setColor([-0.8, -0.8, -0.8], "rgb")
-        self.annote.pos = (0.5, -0.8)  # center-right, bottom of screen
-
-    def block(self, onset, msg):
-        """Show grasp/relax text at specified time.
-        @param onset time to flip text on
-        @param msg   what text to show. ['rest', 'grasp']
+        # annotation for sequence info. see use_annotation
+        self.annote = None
+
+        # pre-rendered block screens. populated by build_cache
+        # shared with earlier runs in the same window
+        self.stim_cache = for_window(self.win)
+        self.prepared = False  # see prepare()
+
+        # events recorded during the run. see add_event
+        self.events = EventBuffer()
+
+        # optional background log writer. see mark()
+        self.async_log = None
+
+        # optional binary trace of pulses (and reversals). see mark_event()
+        self.trace = None
+
+        # pulse to flip timing. see report_latency
+        self.latency = LatencyRecorder()
+
+        # every scanner pulse time. index is pulse number (0 is start pulse)
+        self.pulses = []
+
+        # optional flip timing and dropped frames. see track_flip
+        self.frames = None
+        # measured refresh. run_blocks polls once a frame (default rate without it)
+        self.clock = None
+
+        # run_blocks state. current block and pulse counts
+        self.block_i = 0
+        self.block_label = None
+        self.block_trs = 0  # pulses counted toward the current block
+        self.pulse_i = 0  # pulses seen. start pulse is 0
+        self.tr_times = [0, 0]  # first two pulse intervals. likely BOLD then VASO
+        self.start_pulse_time = 0
+        self.loop_times = None  # (wall, cpu) seconds of the block loop. see bench_timing.py
+
+        # optional gc/priority/affinity control. see use_realtime
+        self.realtime = None
+
+        # scanner pulses with keypress (not poll) timestamps
+        if triggers is None:
+            triggers = KeyboardTriggers(TRIGGERS)
+        self.triggers = triggers
+
+    def style_block(self, msg):
+        """Set msgbox size, text, and color for a block.
+        Slow: text is laid out again. Use build_cache before the task starts.
+        @param msg what text to show. ['rest', 'grasp']
         """
         self.msgbox.height = 0.5
         self.msgbox.text = msg
-        textcolor = [1, 1, 1]
+        textcolor = [1, 1, 1]  # white
         if msg == GRASP_TEXT:
             textcolor = [1, -0.3, -0.3]  # red
-        self.msgbox.setColor(textcolor, "rgb")  # white
-        self.msgbox.draw()
-        self.annote.draw()
-        return self.flip_at(onset, msg)
+        self.msgbox.setColor(textcolor, "rgb")
+
+    def build_cache(self, labels=BLOCK_ORDER):
+        """Render waiting screen and each block into textures.
+        Call before get_ready. msgbox style is restored afterwards.
+        Screens already cached for this window are not rendered again.
+        @param labels block text to pre-render
+        """
+        prev = (self.msgbox.text, self.msgbox.height, self.msgbox.color)
+        # waiting screen keeps current msgbox style
+        if WAIT_TEXT not in self.stim_cache:
+            self.msgbox.text = WAIT_TEXT
+            self.stim_cache.add(WAIT_TEXT, self.msgbox)
+        for msg in labels:
+            if msg in self.stim_cache:
+                continue
+            self.style_block(msg)
+            self.stim_cache.add(msg, self.msgbox)
+        self.msgbox.text, self.msgbox.height, self.msgbox.color = prev
+
+    def use_annotation(self):
+        """Show the --annotate overlay. Its digit glyphs are built once per window.
+        Call before get_ready."""
+        self.annote = self.stim_cache.shared("annotation", lambda: Annotation(self.win))
+        self.annote.update((), "")
+
+    def prepare(self):
+        """Build everything the timing critical loop draws.
+        Slow. Before get_ready (or before the dialog with --fast-start)."""
+        self.build_cache()
+        self.prepared = True
+
+    def draw_block(self, msg):
+        """Draw block text and annotation to the back buffer. Does not flip.
+        @param msg what text to show. ['rest', 'grasp']
+        """
+        if msg in self.stim_cache:
+            self.stim_cache.draw(msg)
+        else:
+            self.style_block(msg)
+            self.msgbox.draw()
+        if self.annote is not None:
+            self.annote.draw()
+
+    def draw_frame(self, block_i, label, ntr):
+        """Draw a block's screen to the back buffer. run_blocks hook.
+        @param block_i block index (annotation)
+        @param label   block text. ['rest', 'grasp']
+        @param ntr     pulses counted toward the block so far (annotation)
+        """
+        if self.annote is not None:
+            self.annote.update(
+                (block_i, ntr), f"{label} {self.tr_times[0]:0.3f} {self.tr_times[1]:0.3f}"
+            )
+        self.draw_block(label)
+
+    def frame_due(self):
+        """When the screen next changes without a pulse. run_blocks hook.
+        @return psychopy.core.getTime() deadline. None: only on pulses (static text)
+        """
+        return None
+
+    def flip_block(self):
+        """Flip the first frame of a new block and mark its label. run_blocks hook.
+        @return flip timestamp
+        """
+        return self.flip_at(0, self.block_label).get("flip", 0)
+
+    def frame_flipped(self, flip, drawn, new_block):
+        """Bookkeeping after each run_blocks flip.
+        @param flip      timestamp returned by win.flip()
+        @param drawn     when drawing finished
+        @param new_block flip started a block
+        """
+        self.track_flip(flip, drawn)
+
+    def block_ended(self, row):
+        """Pulse that ends the current block was counted. run_blocks hook.
+        @param row event row of the block (add_event)
+        """
+        self.frame_block_end(row, self.block_label)
+
+    def mark_pulse(self, t, prev):
+        """Log a scanner pulse. block_trs and pulse_i do not count it yet.
+        @param t    pulse time
+        @param prev previous pulse time
+        """
+        self.mark_event(
+            tracefile.PULSE, t, tracefile.PULSE_MARKS["grasp"],
+            self.block_trs, self.block_i, t, t - prev,
+            block=self.block_i, pulse=self.pulse_i + 1, phase=self.block_trs,
+        )
+
+    def run_blocks(self, schedule, block_pulses, count_start=True, predict=False):
+        """Wait for the start pulse (get_ready), then show blocks in order,
+        each lasting block_pulses scanner pulses. The pulse ending a block flips the next.
+
+        Per frame loop: between frames the trigger queue is polled (escape too)
+        and the screen is redrawn when frame_due() passes or, with annotation, on a pulse.
+        Pulses arriving together are counted one block at a time.
+        Subclasses change what is drawn through the hooks:
+        draw_frame, frame_due, flip_block, frame_flipped, block_ended, mark_pulse.
+
+        @param schedule     [(block_i, label), ...] in order
+        @param block_pulses pulses in each block. the last one starts the next block
+        @param count_start  start pulse counts toward the first block
+        @param predict      draw the next block PREDRAW_LEAD before its expected pulse.
+                            flip as soon as it arrives. see --predict
+        """
+        self.start_pulse_time = self.get_ready()
+        self.pulses.append(self.start_pulse_time)
+        self.mark_external(f"STARTING: recieved first TR pulse {self.start_pulse_time}")
+        loop_start = (time.perf_counter(), time.process_time())
+        period = self.clock.period if self.clock is not None else 1 / DEFAULT_FRAME_RATE
+        tr_prev = self.start_pulse_time  # most recent pulse
+        queued = collections.deque()  # pulses received but not yet counted
+        seq_i = 0
+        self.block_i, self.block_label = schedule[0]
+        self.block_trs = 1 if count_start else 0
+        self.pulse_i = 0
+        block_row = None  # event row of the current block
+        new_block = True  # flip next frame. starts a block
+        redraw = False  # something changed. draw and flip next frame
+        pulse_redraw = False  # redraw is for annotating a pulse
+        predrawn = False  # next block already in back buffer. only flip
+        while seq_i < len(schedule):
+            # --predict: when the pulse ending this block is due. None if not predicting
+            expected = None
+            if (
+                predict
+                and self.tr_times[1]
+                and self.block_trs == block_pulses - 1
+                and seq_i + 1 < len(schedule)
+            ):
+                expected = tr_prev + self.tr_times[self.pulse_i % 2]
+
+            now = psychopy.core.getTime()
+            due = None if predrawn else self.frame_due()
+            if new_block or redraw or (due is not None and now >= due):
+                if not predrawn:
+                    self.draw_frame(self.block_i, self.block_label, self.block_trs)
+                drawn = psychopy.core.getTime()
+                if new_block:
+                    flip = self.flip_block()
+                    self.latency.add("block", tr_prev, drawn, flip)
+                else:
+                    flip = self.win.flip()
+                    if pulse_redraw:
+                        self.latency.add("annotate", tr_prev, drawn, flip)
+                self.frame_flipped(flip, drawn, new_block)
+                if new_block:
+                    self.mark(
+                        "{} flip {:0.4f} secs after pulse", self.block_label, flip - tr_prev
+                    )
+                    # have drawn and flipped. time for computation before the next pulse
+                    block_row = self.add_event(
+                        onset=flip,
+                        event_name=self.block_label,
+                        start_time=self.start_pulse_time,
+                        pulse=self.pulse_i,
+                        block=self.block_i,
+                    )
+                    self.between_blocks()
+                new_block = redraw = pulse_redraw = predrawn = False
+            elif expected is not None and not predrawn and now >= expected - PREDRAW_LEAD:
+                # next block into the back buffer. flips when its pulse arrives
+                self.draw_frame(*schedule[seq_i + 1], 0)
+                predrawn = True
+            else:
+                # nothing to show. wait about a frame for a pulse
+                wake = now + period
+                if due is not None:
+                    wake = min(wake, due)
+                if expected is not None and not predrawn:
+                    wake = min(wake, expected - PREDRAW_LEAD)
+                pulse = self.triggers.wait(until=wake)
+                if pulse is not None:
+                    queued.append(pulse)
+            queued.extend(self.triggers.poll())
+
+            # count pulses until one ends the block. rest wait for its flip
+            while queued and not new_block and self.block_trs < block_pulses:
+                t = queued.popleft()
+                self.mark_pulse(t, tr_prev)
+                if expected is not None and self.block_trs == block_pulses - 1:
+                    if predrawn and t > expected + PREDICT_TOLERANCE:
+                        self.mark("late pulse {:0.3f} secs after expected", t - expected)
+                    elif not predrawn and t < expected - PREDRAW_LEAD:
+                        self.mark("early pulse {:0.3f} secs before expected", expected - t)
+                self.pulses.append(t)
+                # first two intervals. for logging and file name only
+                if self.pulse_i < 2:
+                    self.tr_times[self.pulse_i] = t - tr_prev
+                    self.mark("TR {} is {}", self.pulse_i, self.tr_times[self.pulse_i])
+                tr_prev = t
+                self.block_trs += 1
+                self.pulse_i += 1
+                # annotation shows pulse count. not over a predrawn block: it flips next
+                if self.annote is not None and not predrawn:
+                    redraw = pulse_redraw = True
+
+            if not new_block and self.block_trs >= block_pulses:
+                self.block_ended(block_row)
+                seq_i += 1
+                self.block_trs = 0
+                new_block = True
+                if seq_i < len(schedule):
+                    self.block_i, self.block_label = schedule[seq_i]
+
+        self.loop_times = (
+            time.perf_counter() - loop_start[0],
+            time.process_time() - loop_start[1],
+        )
 
     def instruction(self, msg):
         """Show message and wait for any keyboard resonse.
@@ -73,33 +348,197 @@ class HandGrasp(LNCDTask):
         self.win.flip()
         self.win.color = prev_bgcolor
         # ^ likely last flip don't need to change back. but safer
+        if self.triggers.simulated:
+            # unattended. show but don't wait for a keypress
+            self.msgbox.text = msg
+            self.msgbox.draw()
+            self.win.flip()
+            return None
         # v likewise, return value likely doesn't matter
         return self.msg(msg)
 
-    def get_ready(self, triggers=TRIGGERS):
-        """Wait for scanner trigger. see lncdtask.screen.wait_for_scanner()"""
+    def get_ready(self):
+        """Wait for scanner trigger. see lncdtask.screen.wait_for_scanner()
+        @return timestamp of first pulse"""
         print("Waiting for scanner")
-        self.msgbox.text = "Waiting for Scanner to start"
-        self.msgbox.draw()
+        self.triggers.clear()  # ignore = pushed before now
+        if WAIT_TEXT in self.stim_cache:
+            self.stim_cache.draw(WAIT_TEXT)
+        else:
+            self.msgbox.text = WAIT_TEXT
+            self.msgbox.draw()
         self.win.flip()
-        psychopy.event.waitKeys(keyList=triggers)  # returns key pushed
-        starttime = psychopy.core.getTime()
-        return starttime
+        start = self.triggers.wait()
+        if self.trace is not None:
+            self.trace.add(tracefile.START, start, pulse=0)
+        return start
+
+    def mark_external(self, msg, *args, **kwargs):
+        "Also queue for async_log when set. flip_at marks come through here too."
+        if self.async_log is not None:
+            self.async_log.push(msg)
+        return super().mark_external(msg, *args, **kwargs)
+
+    def mark(self, fmt, *args):
+        """Hot path mark_external. With async_log, formatting is deferred.
+        @param fmt  str.format template
+        @param args values for template
+        """
+        if self.async_log is not None:
+            self.async_log.push(fmt, args)
+        else:
+            self.mark_external(fmt.format(*args))
+
+    def mark_event(self, code, t, fmt, *args, block=-1, pulse=-1, phase=0):
+        """Hot path event: a binary trace record with --trace, otherwise mark(fmt, *args).
+        @param code  tracefile event code. eg tracefile.PULSE
+        @param t     psychopy time of the event
+        @param fmt   text mark template. None: only traced
+        @param block,pulse,phase small integer fields of the record
+        """
+        if self.trace is not None:
+            self.trace.add(code, t, block, pulse, phase)
+        elif fmt is not None:
+            self.mark(fmt, *args)
+
+    def flush_log(self):
+        "Write out queued marks. Call at block boundaries, after the flip."
+        if self.async_log is not None:
+            self.async_log.flush()
+        if self.trace is not None:
+            self.trace.flush()
+
+    def between_blocks(self):
+        "Block boundary housekeeping, after the flip: deferred gc (--realtime) and queued marks."
+        if self.realtime is not None:
+            self.realtime.collect()
+        self.flush_log()
+
+    def use_realtime(self, cpu=None):
+        """Defer gc to block boundaries, raise priority, optionally pin to a cpu.
+        Call just before run_blocks. Undone by stop_realtime.
+        @param cpu core to run on. None: any
+        """
+        self.realtime = RealtimeMode(cpu, self.mark_external)
+        self.realtime.start()
+
+    def stop_realtime(self):
+        "Restore gc, priority, and affinity changed by use_realtime."
+        if self.realtime is not None:
+            self.realtime.stop()
+            self.realtime = None
+
+    def close_log(self):
+        """Write, flush, and fsync queued marks at the end of the run.
+        Also when the run is aborted (escape or an error): the daemon writer thread dies with the process.
+        Later marks go to the other externals only."""
+        if self.async_log is not None:
+            self.async_log.close()
+            self.async_log = None
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def report_latency(self, run_csv=None):
+        """Log pulse to flip latency percentiles for each event type.
+        @param run_csv when given, also save summary next to this file
+        """
+        if run_csv:
+            stats = self.latency.save(sidecar_path(run_csv, "latency"))
+        else:
+            stats = self.latency.summary()
+        for row in stats:
+            self.mark_external(
+                f"latency {row['event']} n={row['n']} p50={row['p50']:0.1f}"
+                + f" p95={row['p95']:0.1f} p99={row['p99']:0.1f}"
+                + f" max={row['max']:0.1f} ms"
+            )
 
-    def add_event(self, onset, event_name, start_time):
+    def add_event(self, onset, event_name, start_time, pulse=-1, block=-1):
         """
-        Add minimal event info to onset_df to save.
+        Add minimal event info to save. See eventbuffer.EventBuffer.
         Column names mirror those used by fixed-timing within lncdtask.
-        onset_df must be initialized with columns: onset, event_name, onset0
+        Call save_events() after the run to populate onset_df.
+        @param pulse index of TR pulse (0 is start pulse) that started event
+        @param block block (or rest+grasp pair) index
+        """
+        row = self.events.add(onset, event_name, onset - start_time, pulse, block)
+        if self.trace is not None:
+            code = self.events.code(event_name)
+            self.trace.add(tracefile.BLOCK, onset, block, pulse, code)
+        return row
+
+    def track_flip(self, flip, drawn, expected=None):
+        """Classify a flip as on time or dropped frames (--frame-stats).
+        Logs flips that missed their vsync.
+        @param flip     timestamp returned by win.flip()
+        @param drawn    when drawing finished
+        @param expected scheduled vsync. default: first vsync after drawn
+        @return frames dropped
+        """
+        if self.frames is None:
+            return 0
+        dropped = self.frames.add(flip, expected, drawn)
+        if dropped:
+            self.mark("dropped {} frames before flip {:0.4f}", dropped, flip)
+        return dropped
+
+    def frame_block_end(self, row, label):
+        """Log frame summary of the block started by event row; save its dropped count.
+        @param row   from add_event
+        @param label block name for the log
         """
-        new_row = pd.DataFrame(
-            {
-                "onset": [onset],
-                "event_name": [event_name],
-                "onset0": [onset - start_time],
-            }
+        if self.frames is None or row is None:
+            return
+        self.events.set(row, "dropped", self.frames.ndropped)
+        self.mark_external(f"frames {label} {self.frames.summary()}")
+        self.frames.block_reset()
+
+    def save_events(self, path):
+        """Convert recorded events to onset_df and write csv.
+        @param path output csv file
+        """
+        self.onset_df = self.events.to_df()
+        self.onset_df.to_csv(path)
+
+    def save_bids_events(self, run_csv):
+        """Write BIDS events tsv next to the run csv (sub-*_task-*_run-*_events.tsv).
+        The last block ends at the final pulse.
+        @return tsv path
+        """
+        ev = self.events
+        names = [ev.names[c] for c in ev.cols["event_name"][: ev.n]]
+        end = self.pulses[-1] - self.pulses[0] if self.pulses else None
+        path = bids_events.bids_path(run_csv)
+        return bids_events.write_events(path, ev.cols["onset0"][: ev.n], names, end)
+
+    def save_design_matrix(self, run_csv):
+        """Write HRF convolved event regressors next to the run csv (*_design.npz).
+        Sampled at each recorded pulse, split by interleave:
+        even pulses (like the start pulse, likely BOLD) and odd (likely VASO).
+        An event lasts until the next one. The last until the final pulse.
+        npz keys: names, pulses (s from start pulse), bold, vaso (volumes x names),
+        bold_times, vaso_times
+        @param run_csv csv written by save_events
+        @return npz path
+        """
+        ev = self.events
+        onset0 = ev.cols["onset0"][: ev.n]
+        codes = ev.cols["event_name"][: ev.n]
+        pulses = np.asarray(self.pulses) - self.pulses[0]
+        dur = np.diff(np.append(onset0, max(pulses[-1], onset0[-1])))
+        X = design.event_regressors(codes, onset0, dur, len(ev.names), pulses)
+        path = sidecar_path(run_csv, "design", ".npz")
+        np.savez_compressed(
+            path,
+            names=np.array(ev.names),
+            pulses=pulses,
+            bold=X[0::2],
+            vaso=X[1::2],
+            bold_times=pulses[0::2],
+            vaso_times=pulses[1::2],
         )
-        self.onset_df = pd.concat([self.onset_df, new_row])
+        return path
 
 
 def args_to_settings(in_args=None) -> dict:
@@ -159,6 +598,71 @@ def args_to_settings(in_args=None) -> dict:
         dest="logging",
         help="Disable dialog popup. Use command line args instead.",
     )
+    parser.add_argument(
+        "--async-log",
+        default=False,
+        action="store_true",
+        dest="async_log",
+        help="Write log on a background thread at block boundaries.",
+    )
+    parser.add_argument(
+        "--predict",
+        default=False,
+        action="store_true",
+        dest="predict",
+        help="Draw next block before its (expected) pulse. Flip when it arrives.",
+    )
+    parser.add_argument(
+        "--fast-start",
+        default=False,
+        action="store_true",
+        dest="fast_start",
+        help="Open window and build stimuli before showing the dialog: OK starts the task without that wait."
+        " Fullscreen only from command line.",
+    )
+    parser.add_argument(
+        "--design-matrix",
+        default=False,
+        action="store_true",
+        dest="design_matrix",
+        help="Also save HRF convolved regressors at each pulse (*_design.npz).",
+    )
+    parser.add_argument(
+        "--trace",
+        default=False,
+        action="store_true",
+        dest="trace",
+        help="Pulses (and reversals) to a binary trace next to the log, not text. analyze_logs.py reads it. see tracefile.py",
+    )
+    parser.add_argument(
+        "--frame-dump",
+        default=False,
+        action="store_true",
+        dest="frame_dump",
+        help="checkboard.py: save the last frames' flip timing (*_frames.csv).",
+    )
+    parser.add_argument(
+        "--frame-stats",
+        default=False,
+        action="store_true",
+        dest="frame_stats",
+        help="Count dropped frames per block (log and csv). Measures refresh rate (~1s). Always on in checkboard.py",
+    )
+    parser.add_argument(
+        "--realtime",
+        default=False,
+        action="store_true",
+        dest="realtime",
+        help="During the run: gc only between blocks, raised priority (psychopy rush). see realtime.py",
+    )
+    parser.add_argument(
+        "--cpu",
+        default=None,
+        type=int,
+        dest="cpu",
+        help="With --realtime, pin the process to this cpu core.",
+    )
+    add_trigger_args(parser)
 
     if in_args is None:
         in_args = sys.argv
@@ -173,57 +677,107 @@ def args_to_settings(in_args=None) -> dict:
         "instructions": args.instructions,
         "fullscreen": not args.no_fullscreen,
         "no_dialog": args.no_dialog,
-        "logging":  args.logging
+        "logging":  args.logging,
+        "async_log": args.async_log,
+        "predict": args.predict,
+        "fast_start": args.fast_start,
+        "design_matrix": args.design_matrix,
+        "trace": args.trace,
+        "frame_dump": args.frame_dump,
+        "frame_stats": args.frame_stats,
+        "realtime": args.realtime,
+        "cpu": args.cpu,
+        **{k: getattr(args, k) for k in TRIGGER_SETTINGS},
     }
     return settings
 
 
-def main(settings):
+def new_task(settings, win=None, task=HandGrasp):
+    """Make window (unless given) and task object.
+    onset_df is typically precomputed. Here events are recorded as they happen
+    (see add_event) and onset_df is made from them at the end (save_events).
+    @param settings dict from args_to_settings
+    @param win      window to reuse
+    @param task     HandGrasp or subclass
+    """
+    # None lets lncdtask figure it out
+    if win is None and not settings["fullscreen"]:
+        win = create_window(False)
+    return task(onset_df=None, win=win, triggers=make_triggers(TRIGGERS, settings))
+
+
+def main(settings, win=None, task=None):
     """
     Run the task.
     @param settings dict of parameters from args_to_settings
+    @param win      window to reuse. default: new window per fullscreen setting
+    @param task     prepared task object from new_task, built ahead (see session.py). default: new
+    @return HandGrasp task object (False if dialog canceled)
     """
+    # imports count only when this run launched the process.
+    # a passed in window or task was set up long before by task_server.py or session.py
+    launched = win is None and task is None
+    timer = StartupTimer(IMPORT_START if launched else None)
+    if launched:
+        timer.phase("imports")
 
     #: dialog's already up if seen, so dont provide option to toggle
     #: logging disableing is only for testing. dont provide option for that (only in CLI params)
-    tweakable = {k: v for k,v in settings.items() if k not in ['no_dialog', 'logging']}
+    #: fast start makes the window before the dialog. can't change fullscreen after
+    hidden = CLI_ONLY + (["fullscreen"] if settings.get("fast_start") else [])
+    tweakable = {k: v for k,v in settings.items() if k not in hidden}
     run_info = RunDialog(
         extra_dict=tweakable, order=["subjid", "ntrials", "ntr","annotate", "instructions", "fullscreen"]
     )
 
+    hc = task
+    if hc is None and settings.get("fast_start"):
+        hc = new_task(settings, win)
+        timer.phase("window")
+        hc.prepare()
+        timer.phase("stimuli")
+        # dialog on top. load post-run modules while operator fills it in
+        hide_window(hc.win)
+        prewarm()
+
     if settings.get("no_dialog"):
         pass # use whatever defaults we were given
     elif not run_info.dlg_ok():
         return False
+    timer.phase("dialog")
 
-    # pull in new settings
+    # pull in new settings. keep command line only settings
     # make sure types are as expected after editing (as string)
-    settings = run_info.info
+    settings = {**settings, **run_info.info}
     settings["ntrials"] = int(settings["ntrials"])
     settings["ntr"] = int(settings["ntr"])
 
     # and get a participant object for saving files
     participant = run_info.mk_participant(["grasp"])
 
-    # onset_df is typically precomputed.
-    # kludge: will popoulate as we go so output csv file still has data for GLM
-    #         but timing will be determined dynamically/at run time by TR pulses
-    empty_df = pd.DataFrame({"onset": [], "event_name": [], "onset0": []})
-
-    win = None # let lncdtask figure it out
-    if not settings['fullscreen']:
-        win = create_window(False)
-    hc = HandGrasp(onset_df=empty_df, win=win)
+    if hc is None:
+        hc = new_task(settings, win)
+        timer.phase("window")
+    else:
+        hide_window(hc.win, False)
 
     # escape quits
     hc.gobal_quit_key()
 
     # record timing to file and to standard out
-    if settings.get("logging"):
-        logger = FileLogger()
-        logger.new(participant.log_path("grasp"))
-        hc.externals.append(logger)  # save events "marked" to a file
-    hc.externals.append(ExternalCom())  # and print to terminal
+    log_path = participant.log_path("grasp") if settings.get("logging") else None
+    if settings.get("async_log"):
+        # same file and printing, but written by a background thread
+        hc.async_log = AsyncLogger(log_path)
+    else:
+        if log_path:
+            logger = FileLogger()
+            logger.new(log_path)
+            hc.externals.append(logger)  # save events "marked" to a file
+        hc.externals.append(ExternalCom())  # and print to terminal
+    if log_path and settings.get("trace"):
+        path = tracefile.trace_path(log_path)
+        hc.trace = tracefile.TraceWriter(path, psychopy.core.getTime(), hc.events.names)
 
     # instructins include specific generated information:
     # how long an and how many trials
@@ -250,83 +804,56 @@ def main(settings):
     if settings["instructions"]:
         hc.run_instructions(instructions)
 
-    # track two TR times. likely BOLD volume and then VASO volume
-    tr_times = [0, 0]
-    # wait for scanner trigger.
-    # This is pulse is recieved precieding the first volume that's collected
-    start_pulse_time = hc.get_ready()
-    hc.mark_external(f"STARTING: recieved first TR pulse {start_pulse_time}")
+    timer.phase("instructions")
+    # layout text now so showing a block after a pulse is only a texture draw
+    if not hc.prepared:
+        hc.prepare()
+        timer.phase("stimuli")
+    if settings.get("annotate"):
+        hc.use_annotation()
+    if settings.get("frame_stats"):
+        hc.clock = hc.stim_cache.shared("clock", lambda: FrameClock(hc.win))
+        hc.frames = FrameRing(hc.clock.period)
+        timer.phase("refresh")
+    hc.mark_external(timer.report())
 
     # ### START TASK ###
-    for block_i in range(settings["ntrials"]):
-        for block_text in BLOCK_ORDER:
-            # drawing will flip after TR pulse recieved. Large (>100ms) delay
-            # between recieved and screen flip
-            #
-            # will send externals (print and mark in file)
-            # see block onset compared to "STARTING" onset
-            if settings.get("annotate"):
-                hc.annote.text = (
-                    f"{block_i} 1? {block_text} {tr_times[0]:0.3f} {tr_times[1]:0.3f}"
-                )
-            block_on_time = hc.block(0, block_text)
-
-            # have drawn and flipped. have some time to do computaiton before expect to recieve next pulse as = key
-            # add timing to dataframe. will save out all as csv when tasks end
-            hc.add_event(
-                onset=block_on_time.get("flip", 0),
-                event_name=block_text,
-                start_time=start_pulse_time,
-            )
-
-            # count number of TRs. used on first pass to get TR of BOLD and VASO
-            # for logging only. Doesn't change task presentation
-            # on the very first block, the first tr capture was eaten by the get ready screen.
-            if block_i == 0 and block_text == BLOCK_ORDER[0]:
-                block_ntr = 1
-                tr_prev = start_pulse_time
-            else:
-                block_ntr = 0
-                # tr_prev set by previous block
-
-            # wait until we've seen enough TRs. log each one.
-            # TR pulse is given at start of volume acq. counting index is 0-based
-            while block_ntr < settings["ntr"]:
-                psychopy.event.waitKeys(keyList=TRIGGERS)
-                tr_on = psychopy.core.getTime()
-                hc.mark_external(
-                    f"Pulse {block_ntr} for block {block_i} recieved {tr_on}; {tr_on-tr_prev:0.3f} secs"
-                )
-
-                # capture TR difference for logging and file name
-                # this is only hit on the very first two pulses
-                mod_i = (block_ntr+1) % 2
-                if tr_times[mod_i] == 0:
-                    tr_times[mod_i] = tr_on - tr_prev
-                    hc.mark_external(f"TR {mod_i} is {tr_times[mod_i]}")
-
-
-                # add current TR annotation? must re-draw grasp/relax text with each TR
-                if settings.get("annotate"):
-                    hc.annote.text = f"{block_i} {block_ntr+1} {block_text} {tr_times[0]:0.3f} {tr_times[1]:0.3f}"
-                    hc.annote.draw()
-                    hc.msgbox.draw()
-                    hc.win.flip()
-
-                # seen and optionally displayed this TR. prepare for next
-                # update for next iteration
-                tr_prev = tr_on
-                block_ntr = block_ntr + 1
-
-
-    psychopy.core.wait(tr_times[1]) # wait for last volume to acquire
+    # every block in order. rest+grasp pairs
+    schedule = [
+        (block_i, block_text)
+        for block_i in range(settings["ntrials"])
+        for block_text in BLOCK_ORDER
+    ]
+    if settings.get("realtime"):
+        hc.use_realtime(settings.get("cpu"))
+    completed = False
+    try:
+        # wait for scanner trigger: the pulse preceding the first volume collected.
+        # it is the first of the first block's ntr pulses.
+        # Each later block flips on the pulse ending the one before it.
+        hc.run_blocks(schedule, settings["ntr"], count_start=True, predict=settings.get("predict"))
+        completed = True
+    finally:
+        # also on escape (core.quit ends the process) or an error
+        hc.stop_realtime()
+        if not completed:
+            hc.close_log()  # keep marks queued since the last block boundary
+    psychopy.core.wait(hc.tr_times[1]) # wait for last volume to acquire
     hc.finished("Done!\nThank you!")
 
     # save complete event info.
+    run_csv = None
     if settings.get("logging"):
-        hc.onset_df.to_csv(
-            participant.run_path(f"grasp_tr1-{tr_times[0]:0.3f}_tr2-{tr_times[1]:0.3f}")
+        run_csv = participant.run_path(
+            f"grasp_tr1-{hc.tr_times[0]:0.3f}_tr2-{hc.tr_times[1]:0.3f}"
         )
+        hc.save_events(run_csv)
+        hc.save_bids_events(run_csv)
+        if settings.get("design_matrix"):
+            hc.save_design_matrix(run_csv)
+    hc.report_latency(run_csv)
+    hc.close_log()
+    return hc
 
 
 if __name__ == "__main__":
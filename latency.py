@@ -0,0 +1,69 @@
+"""
+Scanner pulse to screen change latency.
+
+For each block start (and annotation redraw) keep the pulse time,
+the time drawing finished, and the flip time.
+Summarize as percentiles per event type at the end of the run.
+"""
+
+import os
+import numpy as np
+
+PERCENTILES = (50, 95, 99)  #: reported for each event type
+
+
+class LatencyRecorder:
+    """
+    Rows of (event type, pulse, drawn, flip). All psychopy.core.getTime() seconds.
+    Only a tuple append per event while the task runs.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, kind, pulse, drawn, flip):
+        """Record one pulse triggered screen change.
+        @param kind  event type. eg 'block' or 'annotate'
+        @param pulse when the pulse was received
+        @param drawn when drawing finished (just before flip)
+        @param flip  timestamp returned by flip
+        """
+        self.rows.append((kind, pulse, drawn, flip))
+
+    def summary(self):
+        """Latency stats in milliseconds per event type.
+        @return list of dicts: event, n, p50, p95, p99, max, draw_p50
+        """
+        stats = []
+        kinds = sorted({r[0] for r in self.rows})
+        for kind in kinds:
+            times = np.array([r[1:] for r in self.rows if r[0] == kind])
+            flip_ms = (times[:, 2] - times[:, 0]) * 1000
+            draw_ms = (times[:, 1] - times[:, 0]) * 1000
+            row = {"event": kind, "n": len(flip_ms)}
+            for p, v in zip(PERCENTILES, np.percentile(flip_ms, PERCENTILES)):
+                row[f"p{p}"] = v
+            row["max"] = flip_ms.max()
+            row["draw_p50"] = np.median(draw_ms)
+            stats.append(row)
+        return stats
+
+    def save(self, path):
+        """Write summary() as csv.
+        @param path sidecar file. see sidecar_path
+        @return summary rows
+        """
+        import pandas as pd
+
+        stats = self.summary()
+        pd.DataFrame(stats).to_csv(path, index=False, float_format="%0.3f")
+        return stats
+
+
+def sidecar_path(run_csv, suffix, ext=".csv"):
+    """Name for a file next to the run csv.
+    >>> sidecar_path("sub/grasp_tr1-0.576_tr2-0.448-1770315169.csv", "latency")
+    'sub/grasp_tr1-0.576_tr2-0.448-1770315169_latency.csv'
+    """
+    stem, _ = os.path.splitext(str(run_csv))
+    return f"{stem}_{suffix}{ext}"
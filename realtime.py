@@ -0,0 +1,83 @@
+"""
+Opt-in real-time mode for the pulse/flip loop (--realtime, --cpu).
+
+Python's cyclic garbage collector can pause the loop at any allocation,
+and the OS can schedule other work on our core. While active:
+  * automatic gc is off. collect() runs it at block boundaries and reports how long it took
+  * process priority is raised with psychopy.core.rush
+  * optionally the process is pinned to one cpu
+    (os.sched_setaffinity on linux, psutil on windows/mac when installed)
+stop() restores all three.
+"""
+
+import gc
+import os
+import time
+import psychopy.core
+
+
+def set_affinity(cpus):
+    """Pin this process to cpus. @return previous cpus, None if not supported"""
+    if hasattr(os, "sched_setaffinity"):
+        prev = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+        return prev
+    try:
+        import psutil
+    except ImportError:
+        return None
+    proc = psutil.Process()
+    prev = proc.cpu_affinity()
+    proc.cpu_affinity(list(cpus))
+    return prev
+
+
+class RealtimeMode:
+    """
+    GC control, priority, and affinity for the duration of a run.
+    start() before waiting for the first pulse, collect() at block boundaries, stop() after.
+    """
+
+    def __init__(self, cpu=None, log=print):
+        """
+        @param cpu core to pin to. None leaves affinity alone
+        @param log function taking one message. eg HandGrasp.mark_external
+        """
+        self.cpu = cpu
+        self.log = log
+        self.prev_cpus = None
+        self.gc_secs = []  # duration of each deferred collection
+
+    def start(self):
+        "Collect now, then disable gc and raise priority."
+        gc.collect()
+        gc.disable()
+        rushed = psychopy.core.rush(True)
+        msg = f"realtime: gc off, rush {rushed}"
+        if self.cpu is not None:
+            self.prev_cpus = set_affinity({self.cpu})
+            msg += f", cpu {self.cpu}" if self.prev_cpus is not None else ", cpu affinity unsupported"
+        self.log(msg)
+
+    def collect(self):
+        """Run the deferred gc. Call between blocks, after the flip.
+        @return seconds the collection took
+        """
+        t0 = time.perf_counter()
+        nfreed = gc.collect()
+        secs = time.perf_counter() - t0
+        self.gc_secs.append(secs)
+        self.log(f"gc {nfreed} objects {secs*1000:0.2f} ms")
+        return secs
+
+    def stop(self):
+        "Restore gc, priority, and affinity. Log gc totals."
+        gc.enable()
+        psychopy.core.rush(False)
+        if self.prev_cpus is not None:
+            set_affinity(self.prev_cpus)
+        if self.gc_secs:
+            self.log(
+                f"realtime: {len(self.gc_secs)} gc max {max(self.gc_secs)*1000:0.2f} ms"
+                f" total {sum(self.gc_secs)*1000:0.2f} ms"
+            )
@@ -1,7 +1,8 @@
 REM GRASP TASK ON WINDOW
 REM expect to be a shortcut on the desktop that runs from this directory
 REM python.exe should be on %PATH% from psycophy3 install
-python.exe grasp_trcount.py
+REM --fast-start: window and stimuli are built before the dialog shows. slower to the dialog, faster after OK
+python.exe grasp_trcount.py --fast-start
 echo finished
 
 REM stop to show any errors
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "lncdtask",
+#     "psychopy-visionscience",
+# ]
+#
+# [tool.uv.sources]
+# lncdtask = { git = "https://github.com/LabNeuroCogDevel/lncdtask" }
+# ///
+"""
+Run a scan session's tasks back to back in one window.
+
+A session file lists runs in order, one per line, as task_server.py commands:
+  # session.txt
+  grasp ntr=4 ntrials=10
+  checkers
+  grasp_task dur=20
+
+  python session.py --subjid AAA session.txt
+
+Stimuli for every run are built before the first one.
+Between runs the operator sees what is next and presses space to start it (s skips it).
+Each run writes its own log and csv under subj_info/sub-*/ses-*/ as when run alone.
+"""
+
+import argparse
+import sys
+import time
+import psychopy.event
+import psychopy.visual
+from lncdtask.lncdtask import create_window
+import grasp_trcount
+import checkboard
+import grasp_task
+from task_server import TASKS, parse_command, task_settings
+
+START_KEY = "space"
+SKIP_KEY = "s"
+
+
+def prepared(task):
+    "Build a task's stimuli now. @return task"
+    task.prepare()
+    return task
+
+
+#: task name -> (settings, win) -> task object with stimuli built. run by main(task=)
+WARM = {
+    "grasp": lambda settings, win: prepared(grasp_trcount.new_task(settings, win)),
+    "checkers": lambda settings, win: prepared(
+        grasp_trcount.new_task(settings, win, checkboard.Checkers)
+    ),
+    "grasp_task": grasp_task.new_task,  # schedule (and --design search), frame clock
+}
+
+
+def read_session(path):
+    """Runs listed in a session file.
+    @return list of (task name, setting overrides)
+    """
+    runs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, opts = parse_command(line)
+            runs.append((name, opts))
+    return runs
+
+
+def confirm(win, text):
+    """Show text until the operator starts or skips the run.
+    @return True to run. False to skip
+    """
+    msg = psychopy.visual.TextStim(win, text=text, color="white")
+    msg.draw()
+    win.flip()
+    keys = psychopy.event.waitKeys(keyList=[START_KEY, SKIP_KEY])
+    return keys[0] == START_KEY
+
+
+def run_session(runs, win, common=None):
+    """Run each task in turn in win.
+    @param runs   list of (task name, setting overrides) from read_session
+    @param win    window shared by every run
+    @param common overrides for every run that has the setting. eg subjid
+    @return list of (task name, task object or None if skipped)
+    """
+    common = common or {}
+    plan = []
+    for name, opts in runs:
+        defaults = TASKS[name][0]([]) if name in TASKS else {}
+        shared = {k: v for k, v in common.items() if k in defaults}
+        plan.append((name, task_settings(name, {**shared, **opts})))
+
+    # every run's task object, built now. stimuli shared through stimcache.for_window
+    tasks = [WARM[name](settings, win) if name in WARM else None for name, settings in plan]
+
+    done = []
+    for i, ((name, settings), task) in enumerate(zip(plan, tasks)):
+        text = f"Next: {name} ({i + 1}/{len(plan)})\n\n{START_KEY}: start    {SKIP_KEY}: skip"
+        waited = time.perf_counter()
+        if not confirm(win, text):
+            print(f"session: skipped {name}")
+            done.append((name, None))
+            continue
+        print(f"session: starting {name} after {time.perf_counter() - waited:0.1f}s")
+        _, main = TASKS[name]
+        done.append((name, main(settings, win=win, task=task)))
+    return done
+
+
+def session_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Run a list of tasks in one window")
+    parser.add_argument("session", help="file with one task_server.py command per line")
+    parser.add_argument("--subjid", default=None, help="Subject ID for every run")
+    parser.add_argument(
+        "--set",
+        default=[],
+        action="append",
+        metavar="SETTING=VALUE",
+        help="setting for every run that has it. eg --set simulate=0.576,0.448",
+    )
+    parser.add_argument("--no-fullscreen", default=False, action="store_true", dest="no_fullscreen")
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = session_args(in_args)
+    _, common = parse_command(" ".join(["session"] + args.set))
+    if args.subjid is not None:
+        common["subjid"] = args.subjid
+    runs = read_session(args.session)
+
+    win = create_window(not args.no_fullscreen)
+    done = run_session(runs, win, common)
+    win.close()
+    return done
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+"""
+Startup timing and --fast-start helpers.
+
+Launch to "Waiting for scanner" is imports, RunDialog, window, and stimuli.
+StartupTimer breaks that down. --fast-start only reorders the waits:
+the window and stimuli are made before the dialog appears (window hidden while
+it is up), so pressing OK goes straight to the task. The dialog is modal and
+OpenGL work stays on the main thread, so only imports of post-run modules
+overlap with the operator filling in the dialog.
+"""
+
+import importlib
+import threading
+import time
+
+#: only needed once the run ends (csv, latency summary). imported during dialog
+POST_RUN_MODULES = ["pandas"]
+
+
+class StartupTimer:
+    """
+    Seconds spent in each named startup phase.
+    phase(name) closes the phase that started at the previous call.
+    """
+
+    def __init__(self, t0=None):
+        """@param t0 time.perf_counter() at launch. default now"""
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.last = self.t0
+        self.phases = []
+
+    def phase(self, name):
+        "Record time since previous phase as `name`."
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        """One line summary for the log.
+        >>> t = StartupTimer(0)
+        >>> t.phases = [("imports", 1.5), ("dialog", 2.25)]
+        >>> t.last = 3.75
+        >>> t.report()
+        'startup 3.750s: imports 1.500s, dialog 2.250s'
+        """
+        parts = ", ".join(f"{name} {secs:0.3f}s" for name, secs in self.phases)
+        return f"startup {self.last - self.t0:0.3f}s: {parts}"
+
+
+def prewarm(modules=POST_RUN_MODULES):
+    """Import modules on a background thread (eg while RunDialog is up).
+    A later import in the main thread finds them already loaded.
+    @return started thread
+    """
+
+    def load():
+        for name in modules:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=load, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def hide_window(win, hide=True):
+    """Keep a pre-made (fullscreen) window from covering RunDialog.
+    pyglet windows only. Otherwise does nothing.
+    """
+    handle = getattr(win, "winHandle", None)
+    if hasattr(handle, "set_visible"):
+        handle.set_visible(not hide)
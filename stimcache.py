@@ -0,0 +1,63 @@
+"""
+Pre-rendered screens for block states.
+
+TextStim lays out glyphs whenever text, height or color change.
+Doing that right after a TR pulse delays the flip (see readme: 346 ms START to Relax).
+Instead, render each state once at startup into a BufferImageStim texture.
+Showing a block is then a single texture draw and flip.
+
+for_window() shares one cache per window, so tasks run back to back
+in the same window (task_server.py) build their stimuli only once.
+"""
+
+import psychopy.visual
+
+_BY_WINDOW = {}  # id(win) -> StimCache. see for_window
+
+
+class StimCache:
+    """
+    Named textures captured from the back buffer.
+    Build with add(name, stim) before the task starts,
+    then draw(name) and flip in the timing critical loop.
+    """
+
+    def __init__(self, win):
+        self.win = win
+        self.textures = {}
+        self.objects = {}  # other expensive stimuli. see shared()
+
+    def add(self, name, *stims):
+        """Draw stims to the back buffer and capture as a texture.
+        BufferImageStim clears the back buffer before and after capture.
+        @param name  key used by draw()
+        @param stims already configured stimuli, drawn in order
+        """
+        self.textures[name] = psychopy.visual.BufferImageStim(
+            self.win, stim=list(stims), name=f"cache-{name}"
+        )
+        return self.textures[name]
+
+    def draw(self, name):
+        "Draw pre-rendered texture. Caller flips."
+        self.textures[name].draw()
+
+    def shared(self, name, make):
+        """Build once per window: make() on first call, cached object after.
+        @param name key. eg 'checkers'
+        @param make function returning the stimulus (or measurement)
+        """
+        if name not in self.objects:
+            self.objects[name] = make()
+        return self.objects[name]
+
+    def __contains__(self, name):
+        return name in self.textures
+
+
+def for_window(win):
+    "StimCache shared by every task drawing to win."
+    cache = _BY_WINDOW.get(id(win))
+    if cache is None or cache.win is not win:
+        cache = _BY_WINDOW[id(win)] = StimCache(win)
+    return cache
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "lncdtask",
+#     "psychopy-visionscience",
+# ]
+#
+# [tool.uv.sources]
+# lncdtask = { git = "https://github.com/LabNeuroCogDevel/lncdtask" }
+# ///
+"""
+Long lived task runner: import psychopy and open the window once, then run tasks on command.
+Back to back scans skip the multi-second python/psychopy/window cold start.
+Stimuli are built on the first run and reused (see stimcache.for_window).
+
+Commands are one per line: a task name then setting=value overrides.
+Settings start from that task's command line defaults. The dialog is never shown.
+Each run still writes its own participant log and csv.
+
+  python task_server.py [--no-fullscreen] [--port 5005]
+  grasp subjid=AAA ntr=4 ntrials=10
+  checkers subjid=AAA
+  grasp_task subjid=AAA dur=20
+  quit
+
+Without --port commands are read from stdin. With it, from localhost connections, eg
+  echo "grasp ntr=4 simulate=0.576,0.448" | nc localhost 5005
+
+Escape still quits during a run. That ends the server too.
+"""
+
+import argparse
+import queue
+import socket
+import sys
+import threading
+import psychopy.core
+import psychopy.visual
+from lncdtask.lncdtask import create_window
+import grasp_trcount
+import checkboard
+import grasp_task
+from triggers import trs_arg
+
+#: command name -> (args_to_settings, main)
+TASKS = {
+    "grasp": (grasp_trcount.args_to_settings, grasp_trcount.main),
+    "checkers": (checkboard.args_to_settings, checkboard.main),
+    "grasp_task": (grasp_task.args_to_settings, grasp_task.main),
+}
+IDLE_TEXT = "Waiting for next run"
+IDLE_SECS = 0.1  #: redraw idle screen this often so the window stays responsive
+
+
+def flag(text):
+    """Setting text to bool.
+    >>> flag("no"), flag("True"), flag("1")
+    (False, True, True)
+    """
+    return text.lower() in ("1", "true", "yes", "y")
+
+
+#: setting -> converter for every setting (of any task) that is not text
+CASTS = {
+    "ntrials": int,
+    "ntr": int,
+    "dur": float,
+    "ncandidates": int,
+    "simulate": trs_arg,
+    "sim_jitter": float,
+    "sim_drop": float,
+    "sim_extra": float,
+    "sim_seed": int,
+    "cpu": int,
+    **dict.fromkeys(
+        [
+            "annotate", "instructions", "fullscreen", "no_dialog", "logging",
+            "async_log", "predict", "fast_start", "design_matrix", "trace",
+            "frame_dump", "frame_stats", "realtime", "design",
+        ],
+        flag,
+    ),
+}
+
+
+def parse_command(line):
+    """Split a command line into task and setting overrides.
+    >>> parse_command("grasp ntr=4 ntrials=10")
+    ('grasp', {'ntr': '4', 'ntrials': '10'})
+    """
+    name, *pairs = line.split()
+    opts = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"expected setting=value, got '{pair}'")
+        opts[key] = value
+    return name, opts
+
+
+def task_settings(name, opts):
+    """Settings for one run: task defaults, overrides, and no dialog.
+    @param name key of TASKS
+    @param opts setting -> text from parse_command
+    """
+    if name not in TASKS:
+        raise ValueError(f"unknown task '{name}'. have {', '.join(TASKS)}")
+    args_to_settings, _ = TASKS[name]
+    settings = args_to_settings([])
+    for key, value in opts.items():
+        if key not in settings:
+            raise ValueError(f"unknown setting '{key}' for {name}")
+        if key in CASTS:
+            settings[key] = CASTS[key](value)
+        elif isinstance(settings[key], (str, type(None))):
+            settings[key] = value
+        else:
+            raise ValueError(f"no converter for setting '{key}'. add it to CASTS")
+    settings["no_dialog"] = True
+    if "fast_start" in settings:
+        settings["fast_start"] = False  # window already exists
+    return settings
+
+
+def stdin_commands(commands):
+    "Queue (line, reply) for each line of stdin. Ends with quit."
+    for line in sys.stdin:
+        commands.put((line, print))
+    commands.put(("quit", print))
+
+
+def socket_commands(commands, port):
+    "Queue (line, reply) from connections to localhost:port, one client at a time."
+    with socket.create_server(("127.0.0.1", port)) as server:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("rw") as f:
+
+                def reply(msg, f=f):
+                    # the client may have sent its commands and gone (eg nc -N).
+                    # queued runs still go ahead
+                    try:
+                        f.write(msg + "\n")
+                        f.flush()
+                    except (OSError, ValueError):
+                        pass
+
+                for line in f:
+                    commands.put((line, reply))
+
+
+def serve(commands, win):
+    """Run commands until 'quit'. Window shows IDLE_TEXT between runs.
+    @param commands queue of (line, reply function)
+    @param win      window shared by every run
+    @return number of runs
+    """
+    idle = psychopy.visual.TextStim(win, text=IDLE_TEXT, color="white")
+    nrun = 0
+    while True:
+        idle.draw()
+        win.flip()
+        try:
+            line, reply = commands.get(timeout=IDLE_SECS)
+        except queue.Empty:
+            continue
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "quit":
+            reply("bye")
+            return nrun
+        try:
+            name, opts = parse_command(line)
+            settings = task_settings(name, opts)
+        except ValueError as err:
+            reply(f"error: {err}")
+            continue
+
+        reply(f"running {name} {settings['subjid']}")
+        _, main = TASKS[name]
+        main(settings, win=win)
+        nrun += 1
+        reply(f"done {name}")
+
+
+def server_args(in_args=None):
+    "Command line options. see --help"
+    parser = argparse.ArgumentParser(description="Run tasks in one window on command")
+    parser.add_argument("--port", type=int, default=None, help="listen on localhost instead of stdin")
+    parser.add_argument("--no-fullscreen", default=False, action="store_true", dest="no_fullscreen")
+    return parser.parse_args(in_args)
+
+
+def main(in_args=None):
+    args = server_args(in_args)
+    win = create_window(not args.no_fullscreen)
+    commands = queue.Queue()
+    if args.port is None:
+        reader, reader_args = stdin_commands, (commands,)
+    else:
+        reader, reader_args = socket_commands, (commands, args.port)
+    threading.Thread(target=reader, args=reader_args, name="commands", daemon=True).start()
+
+    serve(commands, win)
+    win.close()
+    psychopy.core.quit()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
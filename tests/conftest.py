@@ -0,0 +1,43 @@
+"""
+Tests import the task modules from the repository root.
+
+Only pure python parts are tested (no window).
+When psychopy is not installed, a minimal stand-in for psychopy.core and
+psychopy.visual lets modules that import it at the top load.
+"""
+
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import psychopy.core  # noqa: F401
+    import psychopy.visual  # noqa: F401
+except ImportError:
+
+    class TextStim:
+        "Records attributes. Enough for modules that build stims at import or init"
+
+        height = 0.1
+
+        def __init__(self, win=None, text="", **kwargs):
+            self.win = win
+            self.text = text
+            for k, v in kwargs.items():
+                setattr(self, k, v)
+
+        def draw(self):
+            pass
+
+    psychopy = types.ModuleType("psychopy")
+    psychopy.core = types.ModuleType("psychopy.core")
+    psychopy.core.getTime = time.perf_counter
+    psychopy.core.wait = lambda secs, hogCPUperiod=0: time.sleep(secs)
+    psychopy.visual = types.ModuleType("psychopy.visual")
+    psychopy.visual.TextStim = TextStim
+    sys.modules.update(
+        {"psychopy": psychopy, "psychopy.core": psychopy.core, "psychopy.visual": psychopy.visual}
+    )
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import analyze_logs
+
+CHECKER_LOG = """\
+100.00000 STARTING: recieved first TR pulse 7.0
+100.30000 block Grid
+100.60000 pulse 0.576 (7.5760)
+101.10000 pulse 0.448 (8.0240)
+"""
+
+GRASP_LOG = """\
+100.00000 STARTING: recieved first TR pulse 7.0
+100.01700 Relax
+100.01710 Relax flip 0.0170 secs after pulse
+100.57600 Pulse 1 for block 0 recieved 7.576; 0.576 secs
+"""
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+
+def test_checker_block_mark_gives_start_latency(tmp_path):
+    parsed = analyze_logs.parse_log(write(tmp_path / "checkers.log", CHECKER_LOG))
+    assert parsed["start_latency"] == pytest.approx(0.3)
+    assert np.allclose(parsed["pulses"], [7.0, 7.576, 8.024])
+
+
+def test_grasp_flip_delay(tmp_path):
+    parsed = analyze_logs.parse_log(write(tmp_path / "grasp.log", GRASP_LOG))
+    assert parsed["start_latency"] == pytest.approx(0.017)
+    assert np.allclose(parsed["pulses"], [7.0, 7.576])
+
+
+def test_find_logs_skips_trace_conversions(tmp_path):
+    logdir = tmp_path / "sub-1" / "ses-1" / "grasp" / "log"
+    write(logdir / "grasp-1770315164.log", GRASP_LOG)
+    write(logdir / "grasp-1770315164_trace.log", GRASP_LOG)
+    logs = analyze_logs.find_logs(str(tmp_path))
+    assert [p.rsplit("/", 1)[1] for p in logs] == ["grasp-1770315164.log"]
@@ -0,0 +1,72 @@
+import pytest
+import annotation
+
+
+class CountingStim:
+    "TextStim stand-in counting layouts (text set) and draws"
+
+    height = 0.1
+
+    def __init__(self, win=None, text="", **kwargs):
+        self.layouts = 0
+        self.draws = 0
+        self.pos = kwargs.get("pos")
+        self.text = text
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self.layouts += 1
+
+    def draw(self):
+        self.draws += 1
+
+
+@pytest.fixture
+def ann(monkeypatch):
+    monkeypatch.setattr(annotation.psychopy.visual, "TextStim", CountingStim)
+    return annotation.Annotation(win=None, ncounters=2, ndigits=3)
+
+
+def all_stims(ann):
+    return [stim for digits in ann.slots for slot in digits for stim in slot.values()]
+
+
+def test_static_text_laid_out_only_on_change(ann):
+    built = ann.static.layouts  # constructor
+    ann.update([0, 1], "Relax")
+    ann.update([0, 2], "Relax")
+    ann.update([1, 1], None)
+    assert ann.static.layouts == built + 1
+    ann.update([1, 2], "Grasp")
+    assert ann.static.layouts == built + 2
+    assert ann.static.text == "Grasp"
+
+
+def test_counters_never_lay_out_glyphs(ann):
+    before = sum(s.layouts for s in all_stims(ann))
+    for i in range(50):
+        ann.update([i, i * 7], "Relax")
+    assert sum(s.layouts for s in all_stims(ann)) == before
+
+
+def test_counters_right_aligned_last_digits(ann):
+    ann.update([7, 1234], "Relax")
+    shown = [stim.text for stim in ann.shown]
+    assert shown == ["7", "2", "3", "4"]
+    # 7 in the first counter's last slot
+    assert ann.shown[0] is ann.slots[0][2]["7"]
+    ann.update([None, 5])
+    assert [stim.text for stim in ann.shown] == ["?", "5"]
+
+
+def test_draw_draws_shown_and_static(ann):
+    ann.update([12, 3], "Relax")
+    ann.draw()
+    assert [stim.draws for stim in ann.shown] == [1, 1, 1]
+    assert ann.static.draws == 1
+    assert sum(s.draws for s in all_stims(ann)) == 3
@@ -0,0 +1,63 @@
+import re
+from asynclog import AsyncLogger
+
+LINE_RE = re.compile(r"^\d+\.\d{5} ")
+
+
+def read_messages(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert all(LINE_RE.match(line) for line in lines)
+    return [line.split(" ", 1)[1] for line in lines]
+
+
+def test_order_and_deferred_format(tmp_path):
+    path = tmp_path / "run.log"
+    log = AsyncLogger(path, echo=False)
+    log.push("STARTING")
+    for i in range(100):
+        log.push("pulse {} ({:0.4f})", (i, i / 2))
+    log.close()
+    msgs = read_messages(path)
+    assert msgs[0] == "STARTING"
+    assert msgs[1] == "pulse 0 (0.0000)"
+    assert msgs[-1] == "pulse 99 (49.5000)"
+    assert len(msgs) == 101
+
+
+def test_timestamps_taken_at_push(tmp_path):
+    path = tmp_path / "run.log"
+    log = AsyncLogger(path, echo=False)
+    for i in range(10):
+        log.push("m{}", (i,))
+    log.close()
+    with open(path) as f:
+        epochs = [float(line.split(" ", 1)[0]) for line in f]
+    assert epochs == sorted(epochs)
+
+
+def test_flush_then_more_then_close(tmp_path):
+    path = tmp_path / "run.log"
+    log = AsyncLogger(path, echo=False)
+    log.push("block 1")
+    log.flush()
+    log.push("block 2")
+    log.close()
+    assert read_messages(path) == ["block 1", "block 2"]
+    assert log.fh is None
+    assert not log._thread.is_alive()
+
+
+def test_braces_without_args_kept(tmp_path):
+    path = tmp_path / "run.log"
+    log = AsyncLogger(path, echo=False)
+    log.push("settings {'ntr': 4}")
+    log.close()
+    assert read_messages(path) == ["settings {'ntr': 4}"]
+
+
+def test_echo_only(capsys):
+    log = AsyncLogger(None, echo=True)
+    log.push("hello {}", ("world",))
+    log.close()
+    assert capsys.readouterr().out.endswith("hello world\n")
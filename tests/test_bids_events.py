@@ -0,0 +1,28 @@
+import os
+import bids_events
+
+SES = os.path.join("sub-AAA", "ses-01")
+
+
+def touch(root, *parts):
+    path = os.path.join(str(root), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+    return path
+
+
+def test_runs_numbered_by_start_per_task(tmp_path):
+    first = touch(tmp_path, SES, "20260205_grasp", "grasp_tr1-0.576_tr2-0.448-1770315169.csv")
+    touch(tmp_path, SES, "20260205_checkers", "checkers_tr1-0.576_tr2-0.448-1770315500.csv")
+    touch(tmp_path, SES, "20260205_grasp", "grasp_tr1-0.576_tr2-0.448-1770315169_latency.csv")
+    # later run on another day's directory of the same session
+    second = touch(tmp_path, SES, "20260206_grasp", "grasp_tr1-0.576_tr2-0.448-1770400000.csv")
+
+    assert os.path.basename(bids_events.bids_path(first)) == "sub-AAA_ses-01_task-grasp_run-1_events.tsv"
+    assert os.path.basename(bids_events.bids_path(second)) == "sub-AAA_ses-01_task-grasp_run-2_events.tsv"
+    assert os.path.dirname(bids_events.bids_path(second)) == os.path.dirname(second)
+
+
+def test_checkers_and_labels(tmp_path):
+    run = touch(tmp_path, "sub-A_1", "ses-01", "20260205_checkers", "checkers_tr1-1.000_tr2-1.000-1770315500.csv")
+    assert os.path.basename(bids_events.bids_path(run)) == "sub-A1_ses-01_task-checkers_run-1_events.tsv"
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import design
+
+
+def one(conds, durs):
+    "single candidate arrays from condition codes and durations"
+    conds = np.array([conds])
+    dur = np.array([durs], dtype=float)
+    return conds, np.cumsum(dur, axis=1) - dur, dur
+
+
+def test_fft_convolution_matches_np_convolve():
+    conds, onsets, dur = one([0, 1, 0, 1], [10, 15, 12, 8])
+    times = np.arange(0, 45, design.DT)
+    reg = design.regressors(conds, onsets, dur, times)[0]
+
+    box = np.zeros(len(times))
+    for c, on, d in zip(conds[0], onsets[0], dur[0]):
+        if c == 1:
+            box[int(round(on / design.DT)) : int(round((on + d) / design.DT))] = 1
+    kernel = design.hrf(np.arange(0, design.HRF_SECS, design.DT))
+    expected = np.convolve(box, kernel)[: len(times)]
+    assert np.allclose(reg, expected, atol=1e-9)
+
+
+def test_alternation_beats_one_long_block():
+    alternating = design.alternating_efficiency(10, 20)
+    conds, onsets, dur = one([0, 1], [200, 200])
+    single = design.efficiency(conds, onsets, dur)[0]
+    assert alternating > 2 * single
+
+
+def test_efficiency_independent_of_batch():
+    short = one([0, 1, 0, 1], [20, 20, 20, 20])
+    long = one([0, 1, 0, 1], [30, 30, 30, 30])
+    alone = design.efficiency(*short)[0]
+    batch = design.efficiency(*(np.concatenate([a, b]) for a, b in zip(short, long)))
+    assert batch[0] == pytest.approx(alone)
+
+
+def test_event_candidates():
+    rng = np.random.default_rng(0)
+    conds, onsets, dur = design.event_candidates(rng, 50, 8, [2.0], (4, 12))
+    assert conds.shape == onsets.shape == dur.shape == (50, 16)
+    assert (conds[:, 1::2] == 1).all()
+    assert (dur[conds == 1] == 2).all()
+    rest = dur[conds == 0]
+    assert rest.min() >= 4 and rest.max() <= 12
+    assert np.allclose(onsets[:, 1:], onsets[:, :-1] + dur[:, :-1])
+
+
+def test_block_candidates_balanced():
+    rng = np.random.default_rng(0)
+    conds, onsets, dur = design.candidates(rng, 20, 5, [15, 20], jitter=2)
+    assert (conds.sum(axis=1) == 5).all()
+    assert (dur[conds == 1] <= 20).all()
+
+
+def test_search_event_related():
+    pytest.importorskip("pandas")
+    onset_df, eff = design.search(100, 5, [2.0], seed=1, isi=(4, 8))
+    assert onset_df.event_name.tolist() == ["rest", "grasp"] * 5
+    assert eff > 0
+
+
+def test_per_scan_efficiency_ignores_length():
+    short = design.alternating_efficiency(10, 20)
+    assert design.alternating_efficiency(20, 20) == pytest.approx(short, rel=0.02)
+
+
+def test_search_not_biased_to_long_schedules():
+    rng = np.random.default_rng(0)
+    conds, onsets, dur = design.candidates(rng, 2000, 10, [15, 20, 25])
+    eff = design.efficiency(conds, onsets, dur)
+    length = np.max(onsets + dur, axis=1)
+    assert abs(np.corrcoef(eff, length)[0, 1]) < 0.15
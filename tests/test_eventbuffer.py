@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from eventbuffer import EventBuffer
+
+
+def test_grows_past_chunk():
+    ev = EventBuffer(chunk=2)
+    for i in range(5):
+        assert ev.add(onset=10 + i, event_name="Relax", onset0=i, pulse=i, block=i // 2) == i
+    assert len(ev) == 5
+    assert len(ev.cols["onset"]) == 8  # 2 -> 4 -> 8
+    assert list(ev.cols["pulse"][:5]) == [0, 1, 2, 3, 4]
+    assert list(ev.cols["onset"][:5]) == [10, 11, 12, 13, 14]
+
+
+def test_names_coded_in_order():
+    ev = EventBuffer()
+    for name in ("Relax", "Grasp", "Relax"):
+        ev.add(0, name, 0)
+    assert ev.names == ["Relax", "Grasp"]
+    assert list(ev.cols["event_name"][:3]) == [0, 1, 0]
+
+
+def test_dropped_set_later():
+    ev = EventBuffer()
+    row = ev.add(1.0, "Grasp", 0.5)
+    assert ev.cols["dropped"][row] == -1
+    ev.set(row, "dropped", 3)
+    assert ev.cols["dropped"][row] == 3
+
+
+def test_to_df():
+    pytest.importorskip("pandas")
+    ev = EventBuffer(chunk=1)
+    ev.add(5.0, "Relax", 0.0, pulse=0, block=0)
+    ev.add(7.5, "Grasp", 2.5, pulse=4, block=0)
+    df = ev.to_df()
+    assert list(df.columns) == ["onset", "event_name", "onset0", "pulse", "block", "dropped"]
+    assert list(df.event_name) == ["Relax", "Grasp"]
+    assert np.allclose(df.onset0, [0, 2.5])
+    assert list(df.pulse) == [0, 4]
+    assert list(df.dropped) == [-1, -1]
+
+
+def test_empty_to_df():
+    pytest.importorskip("pandas")
+    assert len(EventBuffer().to_df()) == 0
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from frameclock import FrameRing, frames_late
+
+PERIOD = 1 / 60
+
+
+def test_on_time_flips_drop_nothing():
+    ring = FrameRing(PERIOD)
+    for k in range(5):
+        # flip lands a little after the vsync it was scheduled for
+        assert ring.add(k * PERIOD + 0.0004, expected=k * PERIOD) == 0
+    assert ring.nlate == 0 and ring.ndropped == 0
+    assert ring.n == 4 and ring.sum / ring.n == pytest.approx(PERIOD)
+
+
+@pytest.mark.parametrize("late_frames", [1, 2, 5])
+def test_dropped_frames_are_whole_frames_late(late_frames):
+    ring = FrameRing(PERIOD)
+    ring.add(0.0, expected=0.0)
+    flip = (1 + late_frames) * PERIOD + 0.001
+    assert ring.add(flip, expected=PERIOD) == late_frames
+    assert ring.nlate == 1 and ring.ndropped == late_frames
+    assert ring.max == pytest.approx(flip)
+
+
+def test_early_or_unclassified_flips():
+    ring = FrameRing(PERIOD)
+    assert ring.add(0.0) == 0  # no expected vsync
+    assert ring.add(PERIOD - 0.002, expected=PERIOD) == 0  # before the vsync is not negative
+    assert ring.ndropped == 0
+
+
+def test_block_reset_keeps_ring():
+    ring = FrameRing(PERIOD)
+    ring.add(0.0, expected=0.0)
+    ring.add(3 * PERIOD, expected=PERIOD)
+    ring.block_reset()
+    assert (ring.n, ring.nlate, ring.ndropped) == (0, 0, 0)
+    ring.add(4 * PERIOD, expected=4 * PERIOD)
+    # interval carries over the reset: the previous flip is still known
+    assert ring.n == 1 and ring.sum == pytest.approx(PERIOD)
+    assert list(ring.dropped[:3]) == [0, 2, 0]
+
+
+def test_wraps_and_dumps_oldest_first(tmp_path):
+    ring = FrameRing(PERIOD, size=4)
+    for k in range(6):
+        ring.add(k * PERIOD, expected=k * PERIOD)
+    assert ring.dump(tmp_path / "frames.csv") == 4
+    rows = np.loadtxt(tmp_path / "frames.csv", delimiter=",", skiprows=1)
+    assert np.allclose(rows[:, 0], np.arange(2, 6) * PERIOD)
+
+
+@pytest.mark.parametrize("drawn_frac", [0.1, 0.5, 0.9])
+def test_drawn_mid_frame(drawn_frac):
+    ring = FrameRing(PERIOD)
+    drawn = (9 + drawn_frac) * PERIOD
+    # on time: the first vsync after drawing finished
+    assert ring.add(10 * PERIOD + 0.0004, drawn=drawn) == 0
+    # missed it, whether drawing ended early or late in the frame
+    assert ring.add(11 * PERIOD + 0.0004, drawn=drawn) == 1
+    assert ring.add(12 * PERIOD + 0.0004, drawn=drawn) == 2
+    assert ring.ndropped == 3
+
+
+def test_frames_late_matches_ring():
+    assert frames_late(11 * PERIOD, 9.9 * PERIOD, PERIOD) == 1
+    assert frames_late(11 * PERIOD, 9.1 * PERIOD, PERIOD) == 1
+    assert frames_late(10 * PERIOD, 9.9 * PERIOD, PERIOD) == 0
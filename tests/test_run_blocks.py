@@ -0,0 +1,162 @@
+"""
+HandGrasp.run_blocks pulse counting with a scripted pulse source and a fake window.
+Time is simulated: waiting for a pulse jumps the clock to it, a flip lands 1 ms later.
+"""
+
+import pytest
+
+pytest.importorskip("lncdtask")
+grasp_trcount = pytest.importorskip("grasp_trcount")
+
+FLIP_LAG = 0.001  #: flip lands this long after it is called
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Win:
+    "Flips at the current simulated time"
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.flips = []
+
+    def flip(self):
+        self.clock.now += FLIP_LAG
+        self.flips.append(self.clock.now)
+        return self.clock.now
+
+
+class Pulses:
+    "Scripted scanner. Same interface as triggers.SimulatedScanner"
+
+    simulated = True
+
+    def __init__(self, clock, times):
+        self.clock = clock
+        self.times = sorted(times)
+
+    def clear(self):
+        pass
+
+    def poll(self):
+        arrived = [t for t in self.times if t <= self.clock.now]
+        self.times = self.times[len(arrived):]
+        return arrived
+
+    def wait(self, until=None):
+        if self.times and (until is None or self.times[0] <= until):
+            self.clock.now = max(self.clock.now, self.times[0])
+            return self.times.pop(0)
+        if not self.times and until is None:
+            raise RuntimeError("run_blocks waited past the last scripted pulse")
+        self.clock.now = max(self.clock.now, until)
+        return None
+
+
+class Task(grasp_trcount.HandGrasp):
+    "HandGrasp without lncdtask's window, dialog, or file logs"
+
+    def __init__(self, clock, pulses):
+        self.win = Win(clock)
+        self.msgbox = None
+        self.marks = []
+        self.drawn = []  # (block_i, label, ntr) of each draw_frame
+        super().__init__(onset_df=None, win=self.win, triggers=Pulses(clock, pulses))
+
+    def get_ready(self):
+        return self.triggers.wait()
+
+    def mark_external(self, msg, *args, **kwargs):
+        self.marks.append(msg)
+
+    def flip_at(self, onset, msg, *args, **kwargs):
+        return {"flip": self.win.flip()}
+
+    def draw_frame(self, block_i, label, ntr):
+        self.drawn.append((block_i, label, ntr))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(grasp_trcount.psychopy.core, "getTime", clock)
+    # LNCDTask.__init__ needs a real window. Task sets what run_blocks uses
+    monkeypatch.setattr(grasp_trcount.LNCDTask, "__init__", lambda self, *a, **k: None)
+    return clock
+
+
+def run(clock, pulses, ntrials=2, block_pulses=3, **kwargs):
+    task = Task(clock, pulses)
+    schedule = [(i, label) for i in range(ntrials) for label in grasp_trcount.BLOCK_ORDER]
+    task.run_blocks(schedule, block_pulses, **kwargs)
+    ev = task.events
+    blocks = [
+        (ev.names[code], int(pulse), float(onset))
+        for code, pulse, onset in zip(
+            ev.cols["event_name"][: ev.n], ev.cols["pulse"][: ev.n], ev.cols["onset"][: ev.n]
+        )
+    ]
+    return task, blocks
+
+
+def steady(n, tr1=0.576, tr2=0.448):
+    "n pulse times alternating between two TRs, starting at 1 s"
+    times, t = [], 1.0
+    for i in range(n):
+        times.append(t)
+        t += tr1 if i % 2 == 0 else tr2
+    return times
+
+
+def test_count_start(clock):
+    # grasp_trcount: the start pulse is the first of block 0's 3.
+    # the last pulse of a block flips the next: blocks start at pulses 0, 2, 5, 8
+    pulses = steady(12)
+    task, blocks = run(clock, pulses, count_start=True)
+    assert [(name, pulse) for name, pulse, _ in blocks] == [
+        ("Relax", 0), ("Grasp", 2), ("Relax", 5), ("Grasp", 8),
+    ]
+    # each block flips just after the pulse that started it
+    for _, pulse, onset in blocks:
+        assert onset == pytest.approx(pulses[pulse] + FLIP_LAG)
+    assert task.pulses == pulses
+
+
+def test_checkers_ntr_plus_one(clock):
+    # checkboard: start pulse not counted, ntr+1 pulses per block after it
+    ntr = 2
+    _, blocks = run(clock, steady(13), block_pulses=ntr + 1, count_start=False)
+    assert [pulse for _, pulse, _ in blocks] == [0, 3, 6, 9]
+
+
+def test_burst_counted_one_block_at_a_time(clock):
+    # pulses 1-5 arrive together. they end blocks 0 and 1, each flipped in turn
+    pulses = [1.0] + [2.0] * 5 + [3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    task, blocks = run(clock, pulses, count_start=True)
+    assert [pulse for _, pulse, _ in blocks] == [0, 2, 5, 8]
+    # pulses queued behind the one ending block 0 are counted after its flip
+    assert 2.0 < blocks[1][2] < blocks[2][2] < 3.0
+    assert task.pulse_i == 11
+
+
+def test_predict_early_and_late(clock):
+    # both TRs are known after pulse 2. blocks start at pulses 0, 2, 5, 8
+    pulses = [1.0 + 0.5 * i for i in range(12)]
+    pulses[5] -= 0.2  # ends block 1 before its pre-draw: drawn after it, as without --predict
+    pulses[8] += 0.1  # ends block 2 late, after block 3 was pre-drawn
+    task, blocks = run(clock, pulses, count_start=True, predict=True)
+    assert [pulse for _, pulse, _ in blocks] == [0, 2, 5, 8]
+    early = [m for m in task.marks if m.startswith("early pulse")]
+    late = [m for m in task.marks if m.startswith("late pulse")]
+    assert early == ["early pulse 0.200 secs before expected"]
+    assert late == ["late pulse 0.100 secs after expected"]
+    # block 3 was drawn ahead (no pulses counted yet) and only flipped on its pulse
+    assert (1, "Grasp", 0) in task.drawn
+    assert blocks[3][2] == pytest.approx(pulses[8] + FLIP_LAG)
+    assert blocks[2][2] == pytest.approx(pulses[5] + FLIP_LAG)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import analyze_logs
+import tracefile
+
+
+def write_trace(path, close=True):
+    tw = tracefile.TraceWriter(str(path), 100.0, ["Relax", "Grasp"])
+    tw.add(tracefile.START, 100.0, pulse=0)
+    tw.add(tracefile.BLOCK, 100.017, 0, 0, 0)
+    tw.add(tracefile.PULSE, 100.576, 0, 1, phase=1)
+    tw.add(tracefile.REVERSAL, 100.7, 0, 1, phase=1)
+    tw.add(tracefile.PULSE, 101.024, 0, 2, phase=2)
+    if close:
+        tw.close()
+    else:
+        tw.flush()
+    return tw
+
+
+def test_round_trip(tmp_path):
+    write_trace(tmp_path / "grasp-1770315164.trace")
+    records, meta = tracefile.read_trace(tmp_path / "grasp-1770315164.trace")
+    assert list(records["code"]) == [1, 3, 2, 4, 2]
+    assert np.allclose(records["t"], [100.0, 100.017, 100.576, 100.7, 101.024])
+    assert list(records["phase"]) == [0, 0, 1, 1, 2]
+    assert list(records["pulse"]) == [0, 0, 1, 1, 2]
+    assert meta["names"] == ["Relax", "Grasp"]
+    assert meta["t0"] == 100.0
+
+
+def test_unclosed_trace_and_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracefile, "CHUNK", 2)
+    tw = write_trace(tmp_path / "grasp-1.trace", close=False)
+    records, meta = tracefile.read_trace(tmp_path / "grasp-1.trace")
+    assert len(records) == 5 and meta["names"] == []
+    tw.f.close()
+
+
+def test_not_a_trace(tmp_path):
+    (tmp_path / "x.trace").write_bytes(b"\0" * tracefile.HEADER.size)
+    with pytest.raises(ValueError):
+        tracefile.read_trace(tmp_path / "x.trace")
+
+
+def test_pulse_lines_match_task_marks(tmp_path):
+    write_trace(tmp_path / "grasp-1.trace")
+    records, meta = tracefile.read_trace(tmp_path / "grasp-1.trace")
+    grasp = [line.split(" ", 1)[1] for line in tracefile.to_log_lines(records, meta, "grasp")]
+    assert grasp == [
+        "Pulse 1 for block 0 recieved 100.576; 0.576 secs\n",
+        "Pulse 2 for block 0 recieved 101.024; 0.448 secs\n",
+    ]
+    checkers = [line.split(" ", 1)[1] for line in tracefile.to_log_lines(records, meta, "checkers")]
+    assert checkers == ["pulse 0.576 (100.5760)\n", "pulse 0.448 (101.0240)\n"]
+
+
+def test_convert_merges_text_log(tmp_path):
+    trace = tmp_path / "checkers-1.trace"
+    write_trace(trace)
+    epoch = tracefile.read_trace(trace)[1]["epoch"]
+    (tmp_path / "checkers-1.log").write_text(
+        f"{epoch:.5f} STARTING: recieved first TR pulse 100.0\n"
+        f"{epoch + 0.3:.5f} block Grid\n"
+        f"{epoch + 2:.5f} Done!\n"
+    )
+    log, csv = tracefile.convert(str(trace))
+    descs = [line.rstrip("\n").split(" ", 1)[1] for line in open(log)]
+    assert descs == [
+        "STARTING: recieved first TR pulse 100.0",
+        "block Grid",
+        "pulse 0.576 (100.5760)",
+        "pulse 0.448 (101.0240)",
+        "Done!",
+    ]
+    parsed = analyze_logs.parse_log(log)
+    assert np.allclose(parsed["pulses"], [100.0, 100.576, 101.024])
+
+
+def test_parse_log_reads_sibling_trace(tmp_path):
+    write_trace(tmp_path / "grasp-1.trace")
+    (tmp_path / "grasp-1.log").write_text(
+        "1.0 STARTING: recieved first TR pulse 100.0\n1.017 Relax flip 0.0170 secs after pulse\n"
+    )
+    parsed = analyze_logs.parse_log(str(tmp_path / "grasp-1.log"))
+    assert np.allclose(parsed["pulses"], [100.0, 100.576, 101.024])
+    assert parsed["start_latency"] == pytest.approx(0.017)
+
+
+def test_close_mid_buffer_keeps_everything(tmp_path):
+    # an aborted run closes whatever is buffered since the last block boundary flush
+    tw = write_trace(tmp_path / "grasp-2.trace", close=False)
+    for i in range(10):
+        tw.add(tracefile.PULSE, 102.0 + i, 1, 3 + i, phase=i)
+    tw.close()
+    tw.close()
+    records, meta = tracefile.read_trace(tmp_path / "grasp-2.trace")
+    assert len(records) == 15 and meta["names"] == ["Relax", "Grasp"]
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Compact binary trace of hot path events (--trace).
+
+Every scanner pulse and checker reversal as a text mark means string
+formatting and a file write between flips. Instead, each event is a fixed
+20 byte record packed into a preallocated buffer and written in chunks:
+  t      f8  psychopy.core.getTime() of the event
+  code   u2  START, PULSE, BLOCK, REVERSAL
+  phase  i2  BLOCK: event_name code. REVERSAL: checker phase. PULSE: pulses counted toward the block
+  block  i4  block index (-1 if not applicable)
+  pulse  i4  pulse index (-1 if not applicable)
+A 24 byte header holds the clock offset (epoch vs psychopy time).
+On close, a json trailer maps event_name codes to text.
+
+Only pulses go missing from the text log: block starts and flip delays are still marked.
+analyze_logs.parse_log reads pulses from the trace next to a log.
+The converter merges the pulses back into a copy of the text log,
+formatted as the task would have marked them, and writes block events as a run csv:
+  python tracefile.py subj_info/.../log/grasp-1770315164.trace
+Reversals are only in the trace (and its csv). They were never text marks.
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+MAGIC = b"HGTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHdd")  #: magic, version, pad, epoch, psychopy time
+RECORD = struct.Struct("<dHhii")  #: t, code, phase, block, pulse
+TRAILER = struct.Struct("<I4s")  #: json length, magic
+DTYPE = np.dtype(
+    [("t", "<f8"), ("code", "<u2"), ("phase", "<i2"), ("block", "<i4"), ("pulse", "<i4")]
+)  #: RECORD as numpy. same packed layout
+CHUNK = 4096  #: records buffered between writes
+
+# event codes
+START = 1
+PULSE = 2
+BLOCK = 3
+REVERSAL = 4
+
+#: pulse marks by task (log file prefix). HandGrasp.mark_pulse and Checkers.mark_pulse
+PULSE_MARKS = {
+    "grasp": "Pulse {} for block {} recieved {}; {:0.3f} secs",
+    "checkers": "pulse {:-0.3f} ({:0.4f})",
+}
+
+
+def trace_path(log_path):
+    """Trace file next to the text log.
+    >>> trace_path("sub/log/grasp-1770315164.log")
+    'sub/log/grasp-1770315164.trace'
+    """
+    stem, _ = os.path.splitext(str(log_path))
+    return f"{stem}.trace"
+
+
+class TraceWriter:
+    """
+    Append fixed size records. add() is a struct pack into a preallocated buffer.
+    The buffer is written when full and on flush() (eg at block boundaries).
+    """
+
+    def __init__(self, path, t0, names=None):
+        """
+        @param path  output file
+        @param t0    psychopy.core.getTime() now. pairs with epoch in header
+        @param names event_name code -> text. list, can grow until close()
+        """
+        self.path = path
+        self.names = names if names is not None else []
+        self.buf = bytearray(RECORD.size * CHUNK)
+        self.n = 0  # records in buf
+        self.f = open(path, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, time.time(), t0))
+
+    def add(self, code, t, block=-1, pulse=-1, phase=0):
+        "Record one event. see module docstring for fields"
+        RECORD.pack_into(self.buf, self.n * RECORD.size, t, code, phase, block, pulse)
+        self.n += 1
+        if self.n == CHUNK:
+            self.flush()
+
+    def flush(self):
+        "Write buffered records."
+        self.f.write(memoryview(self.buf)[: self.n * RECORD.size])
+        self.n = 0
+        self.f.flush()
+
+    def close(self):
+        """Write remaining records and the names trailer.
+        Also called when a run is aborted (HandGrasp.close_log). Closing again does nothing."""
+        if self.f.closed:
+            return
+        self.flush()
+        meta = json.dumps({"names": list(self.names)}).encode()
+        self.f.write(meta + TRAILER.pack(len(meta), MAGIC))
+        self.f.close()
+
+
+def read_trace(path):
+    """Records and metadata of a trace. Works without trailer (run did not close).
+    @return (numpy structured array of DTYPE, dict with epoch, t0, names)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _, epoch, t0 = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a trace file")
+    meta = {"epoch": epoch, "t0": t0, "names": []}
+    end = len(data)
+    if end - HEADER.size >= TRAILER.size:
+        meta_len, tail = TRAILER.unpack_from(data, end - TRAILER.size)
+        if tail == MAGIC:
+            end -= TRAILER.size + meta_len
+            meta.update(json.loads(data[end : end + meta_len]))
+    nrec = (end - HEADER.size) // RECORD.size
+    records = np.frombuffer(data, dtype=DTYPE, count=nrec, offset=HEADER.size)
+    return records, meta
+
+
+def name_of(meta, code):
+    "event_name text for a BLOCK record's phase"
+    names = meta["names"]
+    return names[code] if 0 <= code < len(names) else f"event{code}"
+
+
+def task_of(path):
+    """Task that wrote a trace or log, from the file name.
+    >>> task_of("sub/log/checkers-1770315164.trace")
+    'checkers'
+    """
+    prefix = os.path.basename(str(path)).split("-")[0]
+    return prefix if prefix in PULSE_MARKS else "grasp"
+
+
+def pulse_times(records):
+    "psychopy times of the start pulse and every pulse after it"
+    return records["t"][(records["code"] == START) | (records["code"] == PULSE)]
+
+
+def to_log_lines(records, meta, task="grasp"):
+    """Pulse marks, 'epoch description', as the task would have written them.
+    Other marks (start, blocks, flip delays) are still in the text log.
+    @param task key of PULSE_MARKS
+    """
+    fmt = PULSE_MARKS[task]
+    lines = []
+    prev = None
+    for rec in records:
+        t = float(rec["t"])
+        if rec["code"] == PULSE and prev is not None:
+            if task == "checkers":
+                desc = fmt.format(t - prev, t)
+            else:
+                desc = fmt.format(rec["phase"], rec["block"], t, t - prev)
+            epoch = meta["epoch"] + (t - meta["t0"])
+            lines.append(f"{epoch:.5f} {desc}\n")
+        if rec["code"] in (START, PULSE):
+            prev = t
+    return lines
+
+
+def merge_lines(*logs):
+    """Interleave log lines by their leading epoch. Order kept for ties and unparsable lines.
+    >>> merge_lines(["1.0 a\\n", "3.0 c\\n"], ["2.0 b\\n"])
+    ['1.0 a\\n', '2.0 b\\n', '3.0 c\\n']
+    """
+    keyed = []
+    for lines in logs:
+        key = float("-inf")
+        for line in lines:
+            try:
+                key = float(line.split(" ", 1)[0])
+            except ValueError:
+                pass
+            keyed.append((key, len(keyed), line))
+    return [line for _, _, line in sorted(keyed)]
+
+
+def to_events_df(records, meta):
+    "Block events as the run csv (eventbuffer columns)."
+    import pandas as pd
+
+    start = records["t"][records["code"] == START]
+    t_start = start[0] if len(start) else 0
+    blocks = records[records["code"] == BLOCK]
+    return pd.DataFrame(
+        {
+            "onset": blocks["t"],
+            "event_name": [name_of(meta, c) for c in blocks["phase"]],
+            "onset0": blocks["t"] - t_start,
+            "pulse": blocks["pulse"],
+            "block": blocks["block"],
+        }
+    )
+
+
+def convert(path):
+    """Write *_trace.log (the run's text log with pulses merged in) and *_trace.csv next to the trace.
+    Not *.log: that is the run's own text log.
+    @return (log path, csv path)
+    """
+    records, meta = read_trace(path)
+    stem, _ = os.path.splitext(path)
+    text = []
+    if os.path.exists(f"{stem}.log"):
+        with open(f"{stem}.log", errors="replace") as f:
+            text = f.readlines()
+    log, csv = f"{stem}_trace.log", f"{stem}_trace.csv"
+    with open(log, "w") as f:
+        f.writelines(merge_lines(text, to_log_lines(records, meta, task_of(path))))
+    to_events_df(records, meta).to_csv(csv)
+    return log, csv
+
+
+if __name__ == "__main__":
+    for trace in sys.argv[1:]:
+        print(*convert(trace))
@@ -0,0 +1,234 @@
+"""
+Scanner trigger sources.
+
+The scanner's TTL pulse arrives as an "equal" keypress.
+psychopy.event.waitKeys followed by psychopy.core.getTime() timestamps the pulse
+after polling (and in checkboard.py, after drawing and flipping).
+psychopy.hardware.keyboard (ptb/ioHub backend, as in snd_2026/SoundTest.py)
+reports the OS event time of the keypress instead.
+Timestamps share the psychopy.core.getTime() clock.
+
+SimulatedScanner generates pulses on a TR pattern with the same interface
+for unattended runs (--simulate). Its pulses are returned by poll()/wait() directly,
+never injected as key events: latency measured with it excludes the keyboard path.
+"""
+
+import collections
+import heapq
+import random
+import psychopy.core
+import psychopy.event
+from psychopy.hardware import keyboard
+
+QUIT_KEY = "escape"  #: checked whenever pulses are polled
+POLL_SECS = 0.0005  #: sleep between polls while waiting. timestamp unaffected
+
+
+class KeyboardTriggers:
+    """
+    Pulses from keyboard events with hardware timestamps.
+    wait() blocks for the next pulse. poll() returns all pulses seen since last call.
+    Pulses arriving together are queued, not dropped.
+    """
+
+    simulated = False
+
+    def __init__(self, keys):
+        """@param keys key names that are scanner pulses. eg ['equal']"""
+        self.keys = list(keys)
+        self.kb = keyboard.Keyboard()
+        self.pending = collections.deque()
+
+    def clear(self):
+        "Forget pulses (or keypresses) received so far."
+        self.kb.clearEvents()
+        self.pending.clear()
+
+    def _collect(self):
+        for press in self.kb.getKeys(keyList=self.keys, waitRelease=False):
+            self.pending.append(press.tDown)
+        # keyboard.Keyboard bypasses psychopy.event (and global quit key)
+        if psychopy.event.getKeys(keyList=[QUIT_KEY]):
+            psychopy.core.quit()
+
+    def poll(self):
+        """Non blocking.
+        @return list of pulse timestamps since last poll/wait, oldest first
+        """
+        self._collect()
+        pulses = list(self.pending)
+        self.pending.clear()
+        return pulses
+
+    def wait(self, until=None):
+        """Block until next pulse.
+        @param until give up at this psychopy.core.getTime()
+        @return timestamp of the pulse keypress. None if until passed first
+        """
+        self._collect()
+        while not self.pending:
+            if until is not None and psychopy.core.getTime() >= until:
+                return None
+            psychopy.core.wait(POLL_SECS, hogCPUperiod=0)
+            self._collect()
+        return self.pending.popleft()
+
+
+class SimulatedScanner:
+    """
+    Virtual scanner for unattended runs: same interface as KeyboardTriggers.
+    Pulses follow a repeating TR pattern (eg BOLD then VASO) starting
+    start_delay seconds after clear() (called by get_ready).
+    Timestamps are the scheduled pulse times.
+    """
+
+    simulated = True  #: no one at the keyboard. see HandGrasp.finished
+
+    def __init__(
+        self, trs=(0.576, 0.448), jitter=0, drop=0, extra=0, start_delay=1, seed=None
+    ):
+        """
+        @param trs         seconds between pulses. cycled. eg (0.576, 0.448)
+        @param jitter      standard deviation (seconds) added to each pulse time
+        @param drop        probability a pulse goes missing
+        @param extra       probability of a spurious pulse within a TR
+        @param start_delay seconds from clear() to first pulse
+        @param seed        for repeatable jitter/drop/extra
+        """
+        self.keys = []
+        self.trs = list(trs)
+        self.jitter = jitter
+        self.drop = drop
+        self.extra = extra
+        self.start_delay = start_delay
+        self.rng = random.Random(seed)
+        self.pending = collections.deque()
+        self.extras = []  # heap of spurious pulses not yet due
+        self.nominal = None  # exact TR grid time of next pulse
+        self.next_pulse = None  # nominal + jitter
+        self.tr_i = 0
+
+    def clear(self):
+        "Start the scanner. First pulse is start_delay from now."
+        self.pending.clear()
+        self.extras = []
+        self.tr_i = 0
+        self.nominal = psychopy.core.getTime() + self.start_delay
+        self.next_pulse = self.nominal
+
+    def _collect(self):
+        if self.next_pulse is None:
+            self.clear()
+        now = psychopy.core.getTime()
+        due = []
+        while self.next_pulse <= now:
+            if self.rng.random() >= self.drop:
+                due.append(self.next_pulse)
+            tr = self.trs[self.tr_i % len(self.trs)]
+            if self.rng.random() < self.extra:
+                heapq.heappush(self.extras, self.nominal + self.rng.uniform(0, tr))
+            self.nominal += tr
+            self.next_pulse = self.nominal + self.rng.gauss(0, self.jitter)
+            self.tr_i += 1
+        while self.extras and self.extras[0] <= now:
+            due.append(heapq.heappop(self.extras))
+        self.pending.extend(sorted(due))
+        if psychopy.event.getKeys(keyList=[QUIT_KEY]):
+            psychopy.core.quit()
+
+    def poll(self):
+        """Non blocking.
+        @return list of pulse timestamps since last poll/wait, oldest first
+        """
+        self._collect()
+        pulses = list(self.pending)
+        self.pending.clear()
+        return pulses
+
+    def wait(self, until=None):
+        """Sleep until next pulse.
+        @param until give up at this psychopy.core.getTime()
+        @return scheduled time of the pulse. None if until passed first
+        """
+        self._collect()
+        while not self.pending:
+            now = psychopy.core.getTime()
+            if until is not None and now >= until:
+                return None
+            wake = self.next_pulse
+            if self.extras:
+                wake = min(wake, self.extras[0])
+            if until is not None:
+                wake = min(wake, until)
+            # wake at least every 50ms to check quit key
+            secs = min(wake - now, 0.05)
+            psychopy.core.wait(max(secs, 0), hogCPUperiod=0.002)
+            self._collect()
+        return self.pending.popleft()
+
+
+def trs_arg(text):
+    """Parse comma separated TRs for --simulate.
+    >>> trs_arg("0.576,0.448")
+    [0.576, 0.448]
+    """
+    return [float(tr) for tr in text.split(",")]
+
+
+#: settings added by add_trigger_args. command line only
+TRIGGER_SETTINGS = ["simulate", "sim_jitter", "sim_drop", "sim_extra", "sim_seed"]
+
+
+def add_trigger_args(parser):
+    "Add --simulate and its options to an argparse parser."
+    parser.add_argument(
+        "--simulate",
+        default=None,
+        type=trs_arg,
+        metavar="TR1,TR2",
+        help="No scanner: generate pulses with this TR pattern. eg 0.576,0.448",
+    )
+    parser.add_argument(
+        "--sim-jitter",
+        default=0.0,
+        type=float,
+        dest="sim_jitter",
+        help="Simulated pulse jitter (sd, seconds)",
+    )
+    parser.add_argument(
+        "--sim-drop",
+        default=0.0,
+        type=float,
+        dest="sim_drop",
+        help="Probability a simulated pulse is missing",
+    )
+    parser.add_argument(
+        "--sim-extra",
+        default=0.0,
+        type=float,
+        dest="sim_extra",
+        help="Probability of a spurious simulated pulse each TR",
+    )
+    parser.add_argument(
+        "--sim-seed",
+        default=None,
+        type=int,
+        dest="sim_seed",
+        help="Random seed for repeatable simulated jitter/drop/extra",
+    )
+
+
+def make_triggers(keys, settings):
+    """Trigger source for settings from add_trigger_args.
+    @param keys     pulse keys for KeyboardTriggers
+    @param settings dict with TRIGGER_SETTINGS
+    """
+    if settings.get("simulate"):
+        return SimulatedScanner(
+            trs=settings["simulate"],
+            jitter=settings.get("sim_jitter", 0),
+            drop=settings.get("sim_drop", 0),
+            extra=settings.get("sim_extra", 0),
+            seed=settings.get("sim_seed"),
+        )
+    return KeyboardTriggers(keys)